@@ -0,0 +1,111 @@
+'''
+Compares two versions of a pokerbot against the same opponent on common random numbers.
+
+Version A and version B each play a game against the opponent on every seed,
+as player 1, so both versions are dealt the same cards under the same value
+permutation in every round. The per-round difference between their deltas
+cancels most of the luck of the deal, so it needs far fewer rounds than
+comparing independent runs. In headless mode the pokerbots' own random
+generators are also seeded by the game, so identical versions differ by
+exactly zero.
+'''
+from multiprocessing import Pool
+import argparse
+import random
+import math
+import os
+
+import tournament
+import engine
+from config import *
+
+VERSIONS = ('A', 'B')
+
+
+def paired_summary(differences, deltas):
+    '''
+    Returns lines reporting the paired differences between the versions' deltas, and how
+    their variance compares with that of independent runs.
+
+    Arguments:
+    differences: a list of version A's delta minus version B's delta in each round.
+    deltas: a list of each version's deltas, in the same order.
+    '''
+    mean, variance, (low, high) = tournament.summarize(differences)
+    variances = [tournament.summarize(version_deltas)[1] for version_deltas in deltas]
+    independent = sum(variances)
+    lines = ['Rounds compared: {}'.format(len(differences))]
+    for version, version_deltas in zip(VERSIONS, deltas):
+        lines.append('Mean delta per round of version {}: {:.3f}'.format(version, sum(version_deltas) / len(version_deltas)))
+    lines.append('Mean paired difference A - B per round: {:.3f}'.format(mean))
+    lines.append('Standard deviation: {:.2f}'.format(math.sqrt(variance)))
+    lines.append('95% confidence interval: [{:.3f}, {:.3f}]'.format(low, high))
+    lines.append('Rounds won by A: {}, by B: {}, tied: {}'.format(sum(difference > 0 for difference in differences),
+                                                                 sum(difference < 0 for difference in differences),
+                                                                 sum(difference == 0 for difference in differences)))
+    if variance > 0:
+        lines.append('Paired variance is {:.1%} of independent runs, which would need {:.1f}x the rounds'.format(
+            variance / independent, independent / variance))
+    return lines
+
+
+def parse_args():
+    '''
+    Parses arguments describing the comparison.
+    '''
+    parser = argparse.ArgumentParser(prog='python3 abtest.py')
+    parser.add_argument('--games', type=int, default=10, help='Number of seeds each version plays, defaults to 10')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of worker processes, defaults to the CPU count')
+    parser.add_argument('--seed', type=int, default=None, help='Master seed from which each game seed is derived')
+    parser.add_argument('--duplicate', action='store_true',
+                        help='Also play every seed with seats swapped, over the same deals')
+    parser.add_argument('--log-dir', type=str, default='abtest', help='Directory for per-game logs, defaults to abtest')
+    parser.add_argument('version_a_path', help='The new version of the pokerbot')
+    parser.add_argument('version_b_path', help='The old version of the pokerbot')
+    parser.add_argument('opponent_path', help='The opponent which both versions play')
+    return parser.parse_args()
+
+
+def run_abtest(args):
+    '''
+    Plays both versions against the opponent on every seed on a process pool and reports
+    the paired differences of their deltas in each round.
+    '''
+    master_seed = args.seed if args.seed is not None else random.randrange(2 ** 32)
+    opponent_path = os.path.abspath(args.opponent_path)
+    version_paths = (os.path.abspath(args.version_a_path), os.path.abspath(args.version_b_path))
+    seatings = (False, True) if args.duplicate else (False,)
+    jobs = []
+    job_versions = []
+    for game_num in range(args.games):
+        seed = (master_seed + game_num) % 2 ** 32
+        for version_num, (version, version_path) in enumerate(zip(VERSIONS, version_paths)):
+            for swap_seats in seatings:
+                log_dir = os.path.join(args.log_dir, 'game_{:05d}_{}{}'.format(
+                    game_num, version, '_swapped' if swap_seats else ''))
+                jobs.append(([(game_num, seed, log_dir, swap_seats)], (version_path, opponent_path), True))
+                job_versions.append(version_num)
+    print('Comparing', version_paths[0], 'with', version_paths[1], 'against', opponent_path,
+          'on', args.games, 'seeds with master seed', master_seed)
+    os.makedirs(args.log_dir, exist_ok=True)
+    engine.build_pokerbots(version_paths + (opponent_path,), args.log_dir)
+    # player 1's delta in each round of each game, by version
+    deal_deltas = [{}, {}]
+    with Pool(args.workers) as pool:
+        for version_num, match_results in zip(job_versions, pool.imap(tournament.run_matches, jobs)):
+            for game_num, seed, swap_seats, bankrolls, game_deltas in match_results:
+                for round_num, delta in game_deltas.items():
+                    deal_deltas[version_num][(game_num, swap_seats, round_num)] = delta
+                print('Game', game_num, 'seed', seed, 'version', VERSIONS[version_num] + (' swapped' if swap_seats else ''),
+                      PLAYER_1_NAME, bankrolls[PLAYER_1_NAME])
+    rounds = sorted(set(deal_deltas[0]) & set(deal_deltas[1]))
+    differences = [deal_deltas[0][key] - deal_deltas[1][key] for key in rounds]
+    print()
+    lines = paired_summary(differences, [[version_deltas[key] for key in rounds] for version_deltas in deal_deltas])
+    for line in lines:
+        print(line)
+    return differences
+
+
+if __name__ == '__main__':
+    run_abtest(parse_args())
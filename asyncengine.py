@@ -0,0 +1,559 @@
+'''
+Plays many independent games concurrently in one engine process with asyncio.
+
+Each game is an AsyncGame with its own value permutation, log directory and
+pair of pokerbot processes, and every exchange with a pokerbot is awaited on
+one event loop, so the engine keeps the other tables moving while a pokerbot
+thinks instead of idling on a blocking read. Pokerbots are built once per
+directory before any game starts. Pokerbots always run as subprocesses here,
+whatever HEADLESS says, since in-process pokerbots would block the event loop.
+
+Pokerbots which set "multiplex" in commands.json can instead play all of their
+seat's tables on a few shared processes, with every message and response
+carrying its table id, so precomputed data is loaded once per process rather
+than once per table.
+'''
+import subprocess
+import argparse
+import asyncio
+import random
+import socket
+import shutil
+import tempfile
+import time
+import os
+
+from engine import (Player, PlayerLog, cpu_clock, Game, RoundState, TerminalState, CheckAction, FoldAction, CHECK_ACTIONS,
+                    AVAILABLE_TRANSPORTS, BINARY_RESPONSE, MULTIPLEX_BINARY_RESPONSE, QUIT_MESSAGES,
+                    OUTPUT_CHUNK_SIZE, decode_binary_response, encode_binary_message)
+from tournament import report
+from config import *
+
+
+class AsyncPlayer(Player):
+    '''
+    Handles subprocess and stream interactions with one player's pokerbot on the event loop.
+    '''
+
+    def __init__(self, name, path, log_dir=''):
+        super().__init__(name, path, log_dir)
+        self.reader = None
+        self.writer = None
+        self.read_transport = None
+        self.output_task = None
+
+    async def stream_output(self, out):
+        '''
+        Copies the pokerbot's output to its log in bounded chunks however long the lines.
+        '''
+        while True:
+            chunk = await out.read(OUTPUT_CHUNK_SIZE)
+            if not chunk:
+                break
+            self.player_log.write(chunk)
+
+    async def launch(self, args, pass_fds=()):
+        '''
+        Starts the pokerbot with the given connection arguments and captures its output.
+        '''
+        if self.protocol == 'binary':
+            args = args + ['--binary']
+        self.bot_subprocess = await asyncio.create_subprocess_exec(
+            *(self.commands['run'] + args), stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            cwd=self.path, pass_fds=pass_fds)
+        self.charge_clock = cpu_clock(self.bot_subprocess.pid)
+        self.output_task = asyncio.ensure_future(self.stream_output(self.bot_subprocess.stdout))
+
+    async def accept(self, start_server, args):
+        '''
+        Launches the pokerbot and waits for it to connect to a server started by start_server.
+        '''
+        connected = asyncio.get_running_loop().create_future()
+        def on_connect(reader, writer):
+            if connected.done():
+                writer.close()
+            else:
+                connected.set_result((reader, writer))
+        server = await start_server(on_connect)
+        try:
+            await self.launch(args)
+            # wait until we timeout or the player connects
+            self.reader, self.writer = await asyncio.wait_for(connected, CONNECT_TIMEOUT)
+        finally:
+            server.close()
+        client_socket = self.writer.get_extra_info('socket')
+        if client_socket.family == socket.AF_INET:
+            client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        print(self.name, 'connected successfully')
+
+    async def connect_pipe(self):
+        '''
+        Launches the pokerbot with inherited pipes and waits for it to ack that it is ready.
+        '''
+        engine_read, bot_write = os.pipe()
+        bot_read, engine_write = os.pipe()
+        try:
+            await self.launch(['--pipe', str(bot_read), str(bot_write)], (bot_read, bot_write))
+        finally:
+            os.close(bot_read)
+            os.close(bot_write)
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader()
+        self.read_transport, _ = await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(engine_read, 'rb', 0))
+        transport, protocol = await loop.connect_write_pipe(
+            lambda: asyncio.StreamReaderProtocol(asyncio.StreamReader()), os.fdopen(engine_write, 'wb', 0))
+        writer = asyncio.StreamWriter(transport, protocol, reader, loop)
+        try:
+            if not await asyncio.wait_for(reader.readline(), CONNECT_TIMEOUT):
+                raise BrokenPipeError
+        except (OSError, asyncio.TimeoutError):
+            writer.close()
+            self.read_transport.close()
+            raise
+        self.reader, self.writer = reader, writer
+        print(self.name, 'connected successfully')
+
+    async def run(self):
+        '''
+        Runs the pokerbot and establishes the connection over the first transport in TRANSPORTS
+        which the pokerbot lists in commands.json, or over TCP if it lists none.
+        The binary protocol is used if PROTOCOL asks for it and the pokerbot lists it.
+        '''
+        if self.commands is not None and len(self.commands['run']) > 0:
+            if PROTOCOL == 'binary' and 'binary' in self.commands.get('protocols', ['text']):
+                self.protocol = 'binary'
+
+            bot_transports = self.commands.get('transports', ['tcp'])
+            transport = next((transport for transport in TRANSPORTS
+                              if transport in bot_transports and transport in AVAILABLE_TRANSPORTS), 'tcp')
+            try:
+                if transport == 'pipe':
+                    await self.connect_pipe()
+                elif transport == 'unix':
+                    socket_dir = tempfile.mkdtemp()
+                    socket_path = os.path.join(socket_dir, 'engine.sock')
+                    try:
+                        await self.accept(lambda on_connect: asyncio.start_unix_server(on_connect, socket_path),
+                                          ['--unix', socket_path])
+                    finally:
+                        shutil.rmtree(socket_dir, ignore_errors=True)
+                else:
+                    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                    server_socket.bind(('', 0))
+                    port = server_socket.getsockname()[1]
+                    await self.accept(lambda on_connect: asyncio.start_server(on_connect, sock=server_socket),
+                                      [str(port)])
+            except (TypeError, ValueError):
+                print(self.name, 'run command misformatted')
+            except asyncio.TimeoutError:  # a subclass of OSError from Python 3.11
+                print('Timed out waiting for', self.name, 'to connect')
+            except OSError:
+                print(self.name, 'run failed - check "run" in commands.json')
+
+    async def stop(self):
+        '''
+        Closes the connection and stops the pokerbot.
+        Any pending clauses from the last round are sent along with Q.
+        '''
+        if self.writer is not None:
+            try:
+                if self.pending and self.game_clock > 0.:
+                    self.write(self.encode_message(['T0.'] + self.pending + ['Q']))
+                else:
+                    self.write(QUIT_MESSAGES[self.protocol])
+                await asyncio.wait_for(self.writer.drain(), CONNECT_TIMEOUT)
+            except asyncio.TimeoutError:
+                print('Timed out waiting for', self.name, 'to disconnect')
+            except OSError:
+                print('Could not close socket connection with', self.name)
+            finally:
+                self.writer.close()
+                if self.read_transport is not None:
+                    self.read_transport.close()
+        if self.bot_subprocess is not None:
+            try:
+                await asyncio.wait_for(self.bot_subprocess.wait(), CONNECT_TIMEOUT)
+            except asyncio.TimeoutError:
+                print('Timed out waiting for', self.name, 'to quit')
+                self.bot_subprocess.kill()
+                await self.bot_subprocess.wait()
+            try:
+                await asyncio.wait_for(self.output_task, CONNECT_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
+        self.player_log.close()
+
+    def connected(self):
+        '''
+        Returns whether the pokerbot can currently be queried.
+        '''
+        return self.writer is not None
+
+    def write(self, message):
+        '''
+        Buffers one encoded message for the pokerbot.
+        '''
+        self.writer.write(message if self.protocol == 'binary' else message.encode())
+
+    async def exchange(self, message):
+        '''
+        Sends one message to the pokerbot and returns its response clause.
+        '''
+        self.write(message)
+        await self.writer.drain()
+        if self.protocol == 'binary':
+            try:
+                data = await self.reader.readexactly(BINARY_RESPONSE.size)
+            except asyncio.IncompleteReadError as incomplete_read:
+                data = incomplete_read.partial
+            return decode_binary_response(data)
+        return (await self.reader.readline()).decode().strip()
+
+    async def timed_exchange(self, message):
+        '''
+        Exchanges one message with the pokerbot and returns its response clause
+        with the seconds charged to the pokerbot's game clock.
+        '''
+        start_charge = self.charge_clock()
+        clause = await self.exchange(message)
+        return clause, max(self.charge_clock() - start_charge, 0.)
+
+    async def query(self, round_state, player_message, game_log):
+        '''
+        Requests one action from the pokerbot over its connection.
+        At the end of the round, we request a CheckAction from the pokerbot.
+        '''
+        legal_actions = round_state.legal_actions() if isinstance(round_state, RoundState) else CHECK_ACTIONS
+        if self.connected() and self.game_clock > 0.:
+            try:
+                encode_time = time.perf_counter()
+                message = self.encode_message(player_message)
+                del player_message[1:]  # do not send redundant action history
+                encoded_time = time.perf_counter()
+                clause, seconds = await asyncio.wait_for(self.timed_exchange(message), CONNECT_TIMEOUT)
+                received_time = time.perf_counter()
+                if ENFORCE_GAME_CLOCK:
+                    self.game_clock -= seconds
+                if self.game_clock <= 0.:
+                    raise asyncio.TimeoutError
+                action = self.decode_action(clause, round_state, legal_actions, game_log)
+                decoded_time = time.perf_counter()
+                # latency is wall time as in the engine, whatever the game clock was charged
+                self.latency.record(getattr(round_state, 'street', None), decoded_time - encode_time,
+                                    (encoded_time - encode_time) + (decoded_time - received_time))
+                if action is not None:
+                    return action
+            except asyncio.TimeoutError:
+                self.drop(self.name + ' ran out of time', game_log)
+            except ConnectionError:
+                self.drop(self.name + ' disconnected', game_log)
+            except (IndexError, KeyError, ValueError):
+                game_log.append(self.name + ' response misformatted')
+        else:
+            del player_message[1:]  # the pokerbot will never receive it
+        return CheckAction() if CheckAction in legal_actions else FoldAction()
+
+
+class MultiplexedPlayer(AsyncPlayer):
+    '''
+    Runs one pokerbot process which plays each of its tables over one multiplexed connection.
+    '''
+
+    def __init__(self, name, path, log_dir='', process_num=0):
+        super().__init__(name, path, log_dir)
+        self.player_log = PlayerLog(os.path.join(log_dir, '{}_{}.txt'.format(name, process_num)))
+        self.requests = {}
+        self.last_response_charge = 0.
+        self.response_task = None
+
+    async def launch(self, args, pass_fds=()):
+        '''
+        Starts the pokerbot in multiplexed mode.
+        '''
+        await super().launch(args + ['--multiplex'], pass_fds)
+
+    async def run(self):
+        '''
+        Runs the pokerbot and starts routing its responses to the tables which asked for them.
+        '''
+        await super().run()
+        if self.writer is not None:
+            self.response_task = asyncio.ensure_future(self.route_responses())
+
+    async def read_response(self):
+        '''
+        Returns the table id and clause of the next response, or None once the connection is closed.
+        Raises IndexError or ValueError if the response is misformatted.
+        '''
+        if self.protocol == 'binary':
+            try:
+                data = await self.reader.readexactly(MULTIPLEX_BINARY_RESPONSE.size)
+            except asyncio.IncompleteReadError:
+                return None
+            code, table_id, _, _ = MULTIPLEX_BINARY_RESPONSE.unpack(data)
+            if code != b'I':
+                raise ValueError
+            return table_id, decode_binary_response(data[-BINARY_RESPONSE.size:])
+        line = await self.reader.readline()
+        if not line:
+            return None
+        table_clause, _, clause = line.decode().strip().partition(' ')
+        if table_clause[0] != 'I':
+            raise ValueError
+        return int(table_clause[1:]), clause
+
+    async def route_responses(self):
+        '''
+        Resolves each table's request with its response clause and the seconds the pokerbot
+        spent on it. The pokerbot answers in order, so time spent queued behind the
+        messages of other tables is not charged. Both kinds of charge clock only move
+        forward, so a message's service starts at the later reading of its sending and
+        of the previous response. Once the connection breaks or a response cannot be
+        routed, every waiting table is told that the pokerbot disconnected.
+        '''
+        try:
+            while True:
+                response = await self.read_response()
+                if response is None:
+                    break
+                table_id, clause = response
+                response_charge = self.charge_clock()
+                request = self.requests.pop(table_id, None)
+                if request is not None:
+                    future, sent_charge = request
+                    if not future.done():
+                        service_charge = response_charge - max(sent_charge, self.last_response_charge)
+                        future.set_result((clause, max(service_charge, 0.)))
+                self.last_response_charge = response_charge
+        except (OSError, IndexError, ValueError):
+            pass
+        finally:
+            for future, _ in self.requests.values():
+                if not future.done():
+                    future.set_exception(BrokenPipeError())
+
+    def connected(self):
+        '''
+        Returns whether the pokerbot can currently be queried, which ends once its responses cannot be routed.
+        '''
+        return self.writer is not None and self.response_task is not None and not self.response_task.done()
+
+    async def exchange(self, table_id, message):
+        '''
+        Sends one table's message and returns the response clause with the seconds the pokerbot spent on it.
+        '''
+        future = asyncio.get_running_loop().create_future()
+        self.requests[table_id] = (future, self.charge_clock())
+        try:
+            self.write(message)
+            await self.writer.drain()
+            return await future
+        finally:
+            self.requests.pop(table_id, None)
+
+    async def stop(self):
+        '''
+        Closes the connection, which ends the pokerbot once its tables are over, and stops it.
+        '''
+        if self.writer is not None:
+            self.writer.close()
+            if self.read_transport is not None:
+                self.read_transport.close()
+            self.writer = None
+        await super().stop()
+        if self.response_task is not None:
+            await self.response_task
+
+
+class TablePlayer(AsyncPlayer):
+    '''
+    One table's seat for a pokerbot whose process is shared through a MultiplexedPlayer.
+    '''
+
+    def __init__(self, process, table_id, log_dir=''):
+        super().__init__(process.name, process.path, log_dir)
+        self.process = process
+        self.table_id = table_id
+        self.commands = process.commands
+        self.protocol = process.protocol
+
+    async def run(self):
+        '''
+        Seats the player at its table, which the pokerbot opens on the first message.
+        '''
+
+    def connected(self):
+        '''
+        Returns whether the shared pokerbot can currently be queried.
+        '''
+        return self.process.connected()
+
+    def encode_message(self, player_message):
+        '''
+        Encodes a player message, stamped with the current game clock and the table id.
+        '''
+        if self.protocol == 'binary':
+            return encode_binary_message(self.game_clock, player_message, self.table_id)
+        return 'I{} '.format(self.table_id) + super().encode_message(player_message)
+
+    async def timed_exchange(self, message):
+        '''
+        Exchanges one message over the shared connection and returns the response clause
+        with the seconds the pokerbot spent on it.
+        '''
+        return await self.process.exchange(self.table_id, message)
+
+    async def stop(self):
+        '''
+        Closes the table. Any pending clauses from the last round are sent along with Q.
+        The pokerbot's output is logged by its process, so the table has no log of its own.
+        '''
+        if self.connected():
+            pending = self.pending if self.game_clock > 0. else []
+            try:
+                self.process.write(self.encode_message(['T0.'] + pending + ['Q']))
+                await asyncio.wait_for(self.process.writer.drain(), CONNECT_TIMEOUT)
+            except asyncio.TimeoutError:
+                print('Timed out waiting for', self.name, 'to close table', self.table_id)
+            except OSError:
+                print('Could not close table', self.table_id, 'with', self.name)
+
+
+class AsyncGame(Game):
+    '''
+    Manages logging and the game procedure of one table on the event loop.
+    '''
+
+    async def run_round(self, players, round_num):
+        '''
+        Runs one round of poker.
+        '''
+        round_state = self.deal_round(round_num)
+        history = []
+        while not isinstance(round_state, TerminalState):
+            self.log_round_state(players, round_state)
+            active = round_state.button % 2
+            action = await players[active].query(round_state, self.player_messages[active], self.log)
+            round_state = self.apply_action(players, round_state, action, history)
+        for player, player_message in self.end_round(players, round_num, round_state, history):
+            await player.query(round_state, player_message, self.log)
+
+    async def play(self, players, rounds=None):
+        '''
+        Plays the given rounds, or every round, into the open game log.
+        '''
+        for seated, round_num in self.seatings(players, rounds):
+            await self.run_round(seated, round_num)
+
+    async def run(self, players, rounds=None):
+        '''
+        Runs one game of poker between running pokerbots and returns each player's final bankroll by name.
+        Only the given round numbers are played if rounds is not None.
+        '''
+        for player in players:
+            player.new_game()
+        self.open_logs(players)
+        try:
+            await self.play(players, rounds)
+        finally:
+            self.close_logs()
+        self.report_latency(players)
+        return {player.name: player.bankroll for player in players}
+
+
+async def play_game(game_num, seed, log_dir, player_paths, tables, processes):
+    '''
+    Seats a pair of pokerbots, plays one game between them once a table is free and stops them.
+    A seat with shared processes is played by one of them, and otherwise by a newly launched pokerbot.
+    Returns the game number, seed and bankrolls.
+    '''
+    async with tables:
+        os.makedirs(log_dir, exist_ok=True)
+        players = []
+        for name, path, seat_processes in zip((PLAYER_1_NAME, PLAYER_2_NAME), player_paths, processes):
+            if seat_processes:
+                players.append(TablePlayer(seat_processes[game_num % len(seat_processes)], game_num, log_dir))
+            else:
+                player = AsyncPlayer(name, path, log_dir)
+                player.load_commands()
+                players.append(player)
+        try:
+            await asyncio.gather(*(player.run() for player in players))
+            bankrolls = await AsyncGame(player_paths, log_dir, seed).run(players)
+        finally:
+            await asyncio.gather(*(player.stop() for player in players))
+    return game_num, seed, bankrolls
+
+
+async def play_games(games, player_paths, num_tables, log_dir, multiplex=0):
+    '''
+    Builds each pokerbot directory once, logging to log_dir, and plays every game with at most num_tables at once.
+    If multiplex is positive, each seat whose pokerbot supports it plays all of its tables on multiplex shared processes.
+    Returns the game number, seed and bankrolls of each game as it finishes.
+    '''
+    builders = {}
+    for name, path in zip((PLAYER_1_NAME, PLAYER_2_NAME), player_paths):
+        builders.setdefault(path, Player(name, path, log_dir))
+    await asyncio.gather(*(asyncio.to_thread(builder.build) for builder in builders.values()))
+    processes = []
+    for name, path in zip((PLAYER_1_NAME, PLAYER_2_NAME), player_paths):
+        commands = builders[path].commands
+        if multiplex > 0 and commands is not None and commands.get('multiplex') is True:
+            processes.append([MultiplexedPlayer(name, path, log_dir, process_num) for process_num in range(multiplex)])
+        else:
+            processes.append([])
+    for builder in builders.values():
+        builder.player_log.close()
+    shared = [process for seat_processes in processes for process in seat_processes]
+    for process in shared:
+        process.load_commands()
+    tables = asyncio.Semaphore(num_tables)
+    results = []
+    try:
+        await asyncio.gather(*(process.run() for process in shared))
+        for finished in asyncio.as_completed([play_game(game_num, seed, game_dir, player_paths, tables, processes)
+                                              for game_num, seed, game_dir in games]):
+            game_num, seed, bankrolls = await finished
+            results.append((game_num, seed, bankrolls[PLAYER_1_NAME], bankrolls[PLAYER_2_NAME]))
+            print('Game', game_num, 'seed', seed, PLAYER_1_NAME, bankrolls[PLAYER_1_NAME],
+                  PLAYER_2_NAME, bankrolls[PLAYER_2_NAME])
+    finally:
+        await asyncio.gather(*(process.stop() for process in shared))
+    return results
+
+
+def parse_args():
+    '''
+    Parses arguments describing the games.
+    '''
+    parser = argparse.ArgumentParser(prog='python3 asyncengine.py')
+    parser.add_argument('--games', type=int, default=100, help='Number of games to play, defaults to 100')
+    parser.add_argument('--tables', type=int, default=16, help='Number of games played at once, defaults to 16')
+    parser.add_argument('--seed', type=int, default=None, help='Master seed from which each game seed is derived')
+    parser.add_argument('--multiplex', type=int, default=0,
+                        help='Number of shared processes per seat for pokerbots which support multiplexing, defaults to 0')
+    parser.add_argument('--log-dir', type=str, default='games', help='Directory for per-game logs, defaults to games')
+    parser.add_argument('player_1_path', nargs='?', default=PLAYER_1_PATH, help='Defaults to PLAYER_1_PATH')
+    parser.add_argument('player_2_path', nargs='?', default=PLAYER_2_PATH, help='Defaults to PLAYER_2_PATH')
+    return parser.parse_args()
+
+
+def run_games(args):
+    '''
+    Plays every game on one event loop and reports the aggregate bankroll statistics.
+    '''
+    master_seed = args.seed if args.seed is not None else random.randrange(2 ** 32)
+    player_paths = (os.path.abspath(args.player_1_path), os.path.abspath(args.player_2_path))
+    games = [(game_num, (master_seed + game_num) % 2 ** 32,
+              os.path.join(args.log_dir, 'game_{:05d}'.format(game_num)))
+             for game_num in range(args.games)]
+    os.makedirs(args.log_dir, exist_ok=True)
+    print('Playing', args.games, 'games of', player_paths[0], 'vs', player_paths[1],
+          'on', args.tables, 'tables with master seed', master_seed)
+    results = asyncio.run(play_games(games, player_paths, max(args.tables, 1), args.log_dir, args.multiplex))
+    return report(results, args.log_dir)
+
+
+if __name__ == '__main__':
+    run_games(parse_args())
@@ -0,0 +1,194 @@
+'''
+A vectorized engine which plays many independent tables of poker in lockstep.
+
+Each table holds one round of engine.py's game as rows of NumPy arrays, and
+every call to step applies one action at every table with the rules of
+RoundState.proceed, treating illegal actions as the engine does. Finished
+rounds are scored and immediately re-dealt, following the vectorized
+reset/step convention of gym environments. Each table keeps its value
+permutation until the next reset, as the permutation is fixed for a whole game.
+Cards are indexed as rank * 4 + suit (2c = 0, 2d = 1, ..., As = 51) and
+actions as in handhistory.py.
+'''
+from numpy.random import RandomState
+import numpy as np
+import eval7
+
+from config import STARTING_STACK, BIG_BLIND, SMALL_BLIND
+from handhistory import CARD_STRINGS, FOLD, CALL, CHECK, RAISE
+
+CARDS = [eval7.Card(card) for card in CARD_STRINGS]
+# the street which follows each street, indexed by street
+NEXT_STREET = np.array([3, 0, 0, 4, 5, 0])
+BOARD_POSITIONS = np.arange(5)
+
+
+class BatchEngine():
+    '''
+    Steps num_tables rounds of poker at once.
+    Seat 0 posts the small blind at every table, so the seat to act alternates as in engine.py.
+    '''
+
+    def __init__(self, num_tables, seed=None):
+        self.num_tables = num_tables
+        self.random_state = RandomState(seed)
+        self.tables = np.arange(num_tables)
+        self.button = np.zeros(num_tables, dtype=np.int64)
+        self.street = np.zeros(num_tables, dtype=np.int64)
+        self.pips = np.zeros((num_tables, 2), dtype=np.int64)
+        self.stacks = np.zeros((num_tables, 2), dtype=np.int64)
+        self.hands = np.zeros((num_tables, 2, 2), dtype=np.int64)
+        self.board = np.zeros((num_tables, 5), dtype=np.int64)
+        self.perm_indices = np.tile(np.arange(52), (num_tables, 1))
+
+    def permute_values(self, tables):
+        '''
+        Draws a value permutation for each of the given tables from the engine's prior distribution.
+        '''
+        suits = np.tile(np.arange(4), 13)
+        for table in tables:
+            orig_perm = list(range(13))[::-1]
+            prop_perm = []
+            seed = self.random_state.geometric(p=0.25, size=13) - 1
+            for s in seed:
+                pop_i = len(orig_perm) - 1 - (s % len(orig_perm))
+                prop_perm.append(orig_perm.pop(pop_i))
+            self.perm_indices[table] = np.repeat(prop_perm, 4) * 4 + suits
+
+    def deal(self, tables):
+        '''
+        Starts a new round at each of the given tables.
+        '''
+        cards = self.random_state.rand(len(tables), 52).argsort(axis=1)[:, :9]
+        self.hands[tables] = cards[:, :4].reshape(-1, 2, 2)
+        self.board[tables] = cards[:, 4:]
+        self.button[tables] = 0
+        self.street[tables] = 0
+        self.pips[tables] = (SMALL_BLIND, BIG_BLIND)
+        self.stacks[tables] = (STARTING_STACK - SMALL_BLIND, STARTING_STACK - BIG_BLIND)
+
+    def seat_values(self):
+        '''
+        Returns the active seat at each table with the pips and stacks of the active player and the opponent.
+        '''
+        active = self.button & 1
+        return (active, self.pips[self.tables, active], self.pips[self.tables, 1-active],
+                self.stacks[self.tables, active], self.stacks[self.tables, 1-active])
+
+    def legal_actions(self):
+        '''
+        Returns a boolean array of shape (num_tables, 4) marking the legal moves of each active player.
+        '''
+        _, pip, opp_pip, stack, opp_stack = self.seat_values()
+        continue_cost = opp_pip - pip
+        facing_bet = continue_cost > 0
+        legal = np.empty((self.num_tables, 4), dtype=bool)
+        legal[:, FOLD] = facing_bet
+        legal[:, CALL] = facing_bet
+        legal[:, CHECK] = ~facing_bet
+        # raising is only allowed if both players can afford it
+        legal[:, RAISE] = np.where(facing_bet, (continue_cost != stack) & (opp_stack != 0),
+                                   (self.stacks != 0).all(axis=1))
+        return legal
+
+    def raise_bounds(self):
+        '''
+        Returns arrays of the minimum and maximum legal raises at each table.
+        '''
+        _, pip, opp_pip, stack, opp_stack = self.seat_values()
+        continue_cost = opp_pip - pip
+        max_contribution = np.minimum(stack, opp_stack + continue_cost)
+        min_contribution = np.minimum(max_contribution, continue_cost + np.maximum(continue_cost, BIG_BLIND))
+        return pip + min_contribution, pip + max_contribution
+
+    def showdown(self, tables):
+        '''
+        Compares the players' permuted hands at each of the given tables and returns their deltas.
+        '''
+        scores = np.empty((len(tables), 2), dtype=np.int64)
+        for i, table in enumerate(tables):
+            perm = self.perm_indices[table]
+            board = [CARDS[perm[card]] for card in self.board[table]]
+            for seat in range(2):
+                scores[i, seat] = eval7.evaluate(board + [CARDS[perm[card]] for card in self.hands[table, seat]])
+        stacks = self.stacks[tables]
+        delta = np.where(scores[:, 0] > scores[:, 1], STARTING_STACK - stacks[:, 1],
+                         np.where(scores[:, 0] < scores[:, 1], stacks[:, 0] - STARTING_STACK,
+                                  (stacks[:, 0] - stacks[:, 1]) // 2))  # split the pot on a tie
+        return np.stack([delta, -delta], axis=1)
+
+    def observe(self):
+        '''
+        Returns the state of every table as seen by its active player, as a dict of arrays.
+        Unrevealed board cards are -1.
+        '''
+        active = self.button & 1
+        min_raise, max_raise = self.raise_bounds()
+        return {
+            'active': active,
+            'street': self.street.copy(),
+            'pips': self.pips.copy(),
+            'stacks': self.stacks.copy(),
+            'hands': self.hands[self.tables, active],
+            'board': np.where(BOARD_POSITIONS < self.street[:, None], self.board, -1),
+            'legal_actions': self.legal_actions(),
+            'raise_bounds': np.stack([min_raise, max_raise], axis=1),
+        }
+
+    def reset(self):
+        '''
+        Draws new value permutations, deals a new round at every table and returns the observation.
+        '''
+        self.permute_values(self.tables)
+        self.deal(self.tables)
+        return self.observe()
+
+    def step(self, actions, amounts):
+        '''
+        Applies one action by the active player at every table.
+        Illegal actions are replaced by a check if possible and a fold otherwise.
+
+        Arguments:
+        actions: an array of FOLD, CALL, CHECK or RAISE for each table.
+        amounts: an array of raise-to amounts, ignored for other actions.
+
+        Returns:
+        A tuple of the next observation, an array of shape (num_tables, 2) of each seat's
+        bankroll delta, an array marking the tables whose round ended, which have been
+        dealt a new round, and a dict of the showdown flags, hands and boards of the ended rounds.
+        '''
+        tables = self.tables
+        actions = np.asarray(actions)
+        amounts = np.asarray(amounts)
+        active, pip, opp_pip, stack, _ = self.seat_values()
+        legal = self.legal_actions()
+        min_raise, max_raise = self.raise_bounds()
+        valid = legal[tables, actions] & ((actions != RAISE) | ((min_raise <= amounts) & (amounts <= max_raise)))
+        actions = np.where(valid, actions, np.where(legal[:, CHECK], CHECK, FOLD))
+        deltas = np.zeros((self.num_tables, 2), dtype=np.int64)
+        fold = actions == FOLD
+        fold_delta = np.where(active == 0, self.stacks[:, 0] - STARTING_STACK, STARTING_STACK - self.stacks[:, 1])
+        deltas[fold, 0] = fold_delta[fold]
+        deltas[fold, 1] = -fold_delta[fold]
+        call = actions == CALL
+        sb_call = call & (self.button == 0)  # sb calls bb
+        call &= ~sb_call
+        # both players acted
+        street_over = call | ((actions == CHECK) & (((self.street == 0) & (self.button > 0)) | (self.button > 1)))
+        contributions = np.where(actions == RAISE, amounts - pip, np.where(call, opp_pip - pip, 0))
+        self.stacks[tables, active] = stack - contributions
+        self.pips[tables, active] = pip + contributions
+        self.pips[sb_call] = BIG_BLIND
+        self.stacks[sb_call] = STARTING_STACK - BIG_BLIND
+        self.button += 1
+        showdown = street_over & (self.street == 5)
+        proceed = street_over & ~showdown
+        self.street[proceed] = NEXT_STREET[self.street[proceed]]
+        self.button[proceed] = 1
+        self.pips[proceed] = 0
+        if showdown.any():
+            deltas[showdown] = self.showdown(tables[showdown])
+        done = fold | showdown
+        infos = {'showdown': showdown, 'hands': self.hands.copy(), 'board': self.board.copy()}
+        self.deal(tables[done])
+        return self.observe(), deltas, done, infos
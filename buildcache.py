@@ -0,0 +1,148 @@
+'''
+A content-hashed cache of pokerbot build artifacts.
+
+Builds are keyed by a hash of every file in the pokerbot's directory,
+including commands.json. After a successful build, the files which the build
+created or modified are copied into <cache_dir>/<key>, and later builds with
+the same key restore them instead of running the build command. The artifacts
+of the last build of each directory are left out of its key, so a build does
+not invalidate itself.
+'''
+import tempfile
+import hashlib
+import shutil
+import json
+import os
+
+SKIPPED_DIRS = {'__pycache__'}
+MANIFEST_NAME = 'manifest.json'
+CHUNK_SIZE = 65536
+
+
+def walk_files(path):
+    '''
+    Yields the relative path of every file under path in a stable order, skipping hidden directories.
+    '''
+    for root, dirs, files in os.walk(path):
+        dirs[:] = sorted(name for name in dirs if not name.startswith('.') and name not in SKIPPED_DIRS)
+        for name in sorted(files):
+            yield os.path.relpath(os.path.join(root, name), path).replace(os.sep, '/')
+
+
+def file_digest(filename):
+    '''
+    Returns the SHA-256 hex digest of a file's contents.
+    '''
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as data_file:
+        for chunk in iter(lambda: data_file.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def snapshot(path):
+    '''
+    Returns the size and modification time of every file under path.
+    '''
+    snap = {}
+    for relpath in walk_files(path):
+        stat = os.stat(os.path.join(path, relpath))
+        snap[relpath] = (stat.st_size, stat.st_mtime_ns)
+    return snap
+
+
+def read_json(filename, default):
+    '''
+    Loads a JSON file, or returns default if it is missing or unreadable.
+    '''
+    try:
+        with open(filename, 'r') as json_file:
+            return json.load(json_file)
+    except (OSError, ValueError):
+        return default
+
+
+def write_json(filename, obj):
+    '''
+    Atomically replaces a JSON file.
+    '''
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    fd, temp_name = tempfile.mkstemp(dir=os.path.dirname(filename))
+    with os.fdopen(fd, 'w') as json_file:
+        json.dump(obj, json_file)
+    os.replace(temp_name, filename)
+
+
+class BuildCache():
+    '''
+    Stores and restores build artifacts by the hash of a pokerbot's sources.
+    '''
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    def index_filename(self, path):
+        '''
+        Returns the file listing the artifacts of the last build of a pokerbot directory.
+        '''
+        name = hashlib.sha256(os.path.abspath(path).encode()).hexdigest()[:16]
+        return os.path.join(self.cache_dir, 'paths', name + '.json')
+
+    def source_key(self, path):
+        '''
+        Returns the cache key of a pokerbot directory.
+        '''
+        artifacts = set(read_json(self.index_filename(path), []))
+        digest = hashlib.sha256()
+        for relpath in walk_files(path):
+            if relpath not in artifacts:
+                digest.update('{}\0{}\0'.format(relpath, file_digest(os.path.join(path, relpath))).encode())
+        return digest.hexdigest()
+
+    def restore(self, path):
+        '''
+        Restores the artifacts of a cached build of a pokerbot directory.
+
+        Returns:
+        The seconds the original build took, or None on a cache miss.
+        '''
+        entry = os.path.join(self.cache_dir, self.source_key(path))
+        manifest = read_json(os.path.join(entry, MANIFEST_NAME), None)
+        if manifest is None:
+            return None
+        for relpath, digest in manifest['artifacts'].items():
+            target = os.path.join(path, relpath)
+            if os.path.isfile(target) and file_digest(target) == digest:
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            fd, temp_name = tempfile.mkstemp(dir=os.path.dirname(target))
+            os.close(fd)
+            shutil.copy2(os.path.join(entry, 'files', relpath), temp_name)
+            os.replace(temp_name, target)
+        return manifest['build_time']
+
+    def store(self, path, before, build_time):
+        '''
+        Caches the files which a build created or modified.
+
+        Arguments:
+        path: the pokerbot directory.
+        before: the snapshot of path taken before the build.
+        build_time: the seconds the build took.
+        '''
+        artifacts = {relpath: file_digest(os.path.join(path, relpath))
+                     for relpath, stat in snapshot(path).items() if before.get(relpath) != stat}
+        write_json(self.index_filename(path), sorted(artifacts))
+        entry = os.path.join(self.cache_dir, self.source_key(path))
+        if os.path.isdir(entry):
+            return
+        staging = tempfile.mkdtemp(dir=self.cache_dir)
+        try:
+            for relpath in artifacts:
+                target = os.path.join(staging, 'files', relpath)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.copy2(os.path.join(path, relpath), target)
+            write_json(os.path.join(staging, MANIFEST_NAME), {'artifacts': artifacts, 'build_time': build_time})
+            os.rename(staging, entry)
+        except OSError:  # most likely another engine stored the same build first
+            shutil.rmtree(staging, ignore_errors=True)
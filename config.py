@@ -7,13 +7,40 @@ PLAYER_2_NAME = 'B'
 PLAYER_2_PATH = './python_skeleton'
 # GAME PROGRESS IS RECORDED HERE
 GAME_LOG_FILENAME = 'gamelog'
+# GAME_LOG_COMPRESSION IS None, 'gzip' OR 'lzma'
+GAME_LOG_COMPRESSION = None
+# GAME_LOG_MODE 'text' WRITES THE ENGLISH LOG DURING THE GAME, 'lazy' WRITES ONLY THE HAND HISTORY,
+# FROM WHICH python3 engine.py --render GAME_LOG_FILENAME WRITES IT LATER, AND 'none' WRITES NO ENGLISH LOG
+GAME_LOG_MODE = 'text'
+# THE HAND HISTORY IS WRITTEN TO GAME_LOG_FILENAME.hands AND GAME_LOG_FILENAME.actions
+WRITE_HAND_HISTORY = True
+# EVERY RESPONSE TIME IS ALSO RECORDED TO GAME_LOG_FILENAME.latency, PERCENTILES ARE PRINTED EITHER WAY
+WRITE_LATENCY_LOG = False
+# SEED FIXES THE VALUE PERMUTATION AND EVERY DECK, NONE DRAWS A FRESH SEED
+SEED = None
 # PLAYER_LOG_SIZE_LIMIT IS IN BYTES
 PLAYER_LOG_SIZE_LIMIT = 524288
+# PLAYER_LOG_TAIL_SIZE BYTES FROM THE END OF A LONGER LOG ARE ALSO KEPT, 0 KEEPS ONLY THE START
+PLAYER_LOG_TAIL_SIZE = 0
 # STARTING_GAME_CLOCK AND TIMEOUTS ARE IN SECONDS
 ENFORCE_GAME_CLOCK = True
+# GAME_CLOCK_MODE 'wall' CHARGES THE TIME FROM SENDING EACH MESSAGE TO RECEIVING THE RESPONSE,
+# 'cpu' CHARGES ONLY THE CPU TIME THE POKERBOT'S PROCESSES USED MEANWHILE, ON LINUX
+GAME_CLOCK_MODE = 'wall'
 STARTING_GAME_CLOCK = 30.
 BUILD_TIMEOUT = 20.
 CONNECT_TIMEOUT = 10.
+# BUILDS ARE CACHED IN BUILD_CACHE_DIR BY A HASH OF EACH POKERBOT'S SOURCES, None REBUILDS EVERY TIME
+BUILD_CACHE_DIR = '.build_cache'
+# TRANSPORTS ARE TRIED IN ORDER, USING THE FIRST ONE LISTED BY A POKERBOT IN commands.json
+TRANSPORTS = ['pipe', 'unix', 'tcp']
+# PROTOCOL IS 'text' OR 'binary', BINARY IS USED ONLY WITH POKERBOTS LISTING IT IN commands.json
+PROTOCOL = 'text'
+# PIPELINE_ROUNDS SENDS THE END OF EACH ROUND WITH THE NEXT MESSAGE INSTEAD OF WAITING FOR ACKS,
+# ONLY TO POKERBOTS SETTING "pipeline_rounds" IN commands.json
+PIPELINE_ROUNDS = True
+# HEADLESS MODE IMPORTS PYTHON POKERBOTS INTO THE ENGINE PROCESS INSTEAD OF USING SOCKETS
+HEADLESS = False
 # THE GAME VARIANT FIXES THE PARAMETERS BELOW
 # CHANGE ONLY FOR TRAINING OR EXPERIMENTATION
 NUM_ROUNDS = 1000
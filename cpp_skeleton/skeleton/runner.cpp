@@ -3,23 +3,147 @@
  */
 #include "runner.hpp"
 
-Runner::Runner(Bot* pokerbot, tcp::iostream* stream)
+// binary protocol card codes are rank * 4 + suit
+const string CARD_VALUES = "23456789TJQKA";
+const string CARD_SUITS = "cdhs";
+
+/**
+ * Returns the card string for a binary protocol card code.
+ */
+static string decode_card(unsigned char code)
+{
+    return string(1, CARD_VALUES[code / 4]) + CARD_SUITS[code % 4];
+}
+
+Runner::Runner(Bot* pokerbot, istream* in_stream, ostream* out_stream, bool binary)
 {
     this->pokerbot = pokerbot;
-    this->stream = stream;
+    this->in_stream = in_stream;
+    this->out_stream = out_stream;
+    this->binary = binary;
 }
 
 /**
- * Returns an incoming message from the engine.
+ * Parses an incoming text message.
  */
-vector<string> Runner::receive()
+vector<Clause> Runner::receive_text()
 {
     string line;
-    getline(*(this->stream), line);
+    getline(*(this->in_stream), line);
     trim(line);
     vector<string> packet;
     split(packet, line, is_any_of(" "));
-    return packet;
+    vector<Clause> clauses;
+    for (string text : packet)
+    {
+        Clause clause = { text.at(0), 0, 0., vector<string>() };
+        string leftover = text.substr(1, text.size() - 1);
+        switch (clause.kind)
+        {
+            case 'T':
+            {
+                clause.game_clock = lexical_cast<float>(leftover);
+                break;
+            }
+            case 'P':
+            case 'R':
+            case 'D':
+            {
+                clause.value = lexical_cast<int>(leftover);
+                break;
+            }
+            case 'H':
+            case 'B':
+            case 'O':
+            {
+                split(clause.cards, leftover, is_any_of(","));
+                break;
+            }
+            default:
+            {
+                break;
+            }
+        }
+        clauses.push_back(clause);
+    }
+    return clauses;
+}
+
+/**
+ * Decodes an incoming length-prefixed binary message.
+ */
+vector<Clause> Runner::receive_binary()
+{
+    unsigned char header[2];
+    this->in_stream->read((char*) header, 2);
+    string payload(header[0] << 8 | header[1], '\0');
+    this->in_stream->read(&payload[0], payload.size());
+    const unsigned char* data = (const unsigned char*) payload.data();
+    vector<Clause> clauses;
+    unsigned int i = 0;
+    while (i < payload.size())
+    {
+        Clause clause = { (char) data[i], 0, 0., vector<string>() };
+        switch (clause.kind)
+        {
+            case 'T':
+            {
+                unsigned int millis = data[i+1] << 24 | data[i+2] << 16 | data[i+3] << 8 | data[i+4];
+                clause.game_clock = millis / 1000.;
+                i += 5;
+                break;
+            }
+            case 'P':
+            {
+                clause.value = data[i+1];
+                i += 2;
+                break;
+            }
+            case 'R':
+            {
+                clause.value = data[i+1] << 8 | data[i+2];
+                i += 3;
+                break;
+            }
+            case 'D':
+            {
+                clause.value = (short) (data[i+1] << 8 | data[i+2]);
+                i += 3;
+                break;
+            }
+            case 'H':
+            case 'O':
+            {
+                clause.cards = { decode_card(data[i+1]), decode_card(data[i+2]) };
+                i += 3;
+                break;
+            }
+            case 'B':
+            {
+                for (int j = 0; j < data[i+1]; j++)
+                {
+                    clause.cards.push_back(decode_card(data[i+2+j]));
+                }
+                i += 2 + data[i+1];
+                break;
+            }
+            default:
+            {
+                i += 1;
+                break;
+            }
+        }
+        clauses.push_back(clause);
+    }
+    return clauses;
+}
+
+/**
+ * Returns an incoming message from the engine.
+ */
+vector<Clause> Runner::receive()
+{
+    return this->binary ? this->receive_binary() : this->receive_text();
 }
 
 /**
@@ -27,6 +151,18 @@ vector<string> Runner::receive()
  */
 void Runner::send(Action action)
 {
+    if (this->binary)
+    {
+        const char opcodes[] = { 'F', 'C', 'K', 'R' };
+        int amount = action.action_type == RAISE_ACTION_TYPE ? action.amount : 0;
+        int index = action.action_type == FOLD_ACTION_TYPE ? 0 :
+                    action.action_type == CALL_ACTION_TYPE ? 1 :
+                    action.action_type == CHECK_ACTION_TYPE ? 2 : 3;
+        const char response[] = { opcodes[index], (char) (amount >> 8), (char) (amount & 0xff) };
+        this->out_stream->write(response, 3);
+        this->out_stream->flush();
+        return;
+    }
     string code;
     switch (action.action_type)
     {
@@ -51,7 +187,7 @@ void Runner::send(Action action)
             break;
         }
     }
-    *(this->stream) << code << "\n";
+    *(this->out_stream) << code + "\n" << std::flush;
 }
 
 /**
@@ -65,28 +201,26 @@ void Runner::run()
     bool round_flag = true;
     while (true)
     {
-        vector<string> packet = this->receive();
-        for (string clause : packet)
+        vector<Clause> packet = this->receive();
+        for (Clause clause : packet)
         {
-            string leftover = clause.substr(1, clause.size() - 1);
-            switch (clause.at(0))
+            switch (clause.kind)
             {
                 case 'T':
                 {
                     GameState* freed_game_state = game_state;
-                    game_state = new GameState(game_state->bankroll, lexical_cast<float>(leftover), game_state->round_num);
+                    game_state = new GameState(game_state->bankroll, clause.game_clock, game_state->round_num);
                     delete freed_game_state;
                     break;
                 }
                 case 'P':
                 {
-                    active = lexical_cast<int>(leftover);
+                    active = clause.value;
                     break;
                 }
                 case 'H':
                 {
-                    vector<string> cards;
-                    split(cards, leftover, is_any_of(","));
+                    vector<string> cards = clause.cards;
                     array< array<string, 2>, 2> hands = { "" };
                     hands[active] = (array<string, 2>) { cards[0], cards[1] };
                     array<string, 5> deck = { "" };
@@ -117,13 +251,12 @@ void Runner::run()
                 }
                 case 'R':
                 {
-                    round_state = ((RoundState*) round_state)->proceed(RaiseAction(lexical_cast<int>(leftover)));
+                    round_state = ((RoundState*) round_state)->proceed(RaiseAction(clause.value));
                     break;
                 }
                 case 'B':
                 {
-                    vector<string> cards;
-                    split(cards, leftover, is_any_of(","));
+                    vector<string> cards = clause.cards;
                     array<string, 5> revised_deck = { "" };
                     for (unsigned int i = 0; i < cards.size(); i++)
                     {
@@ -138,8 +271,7 @@ void Runner::run()
                 case 'O':
                 {
                     // backtrack
-                    vector<string> cards;
-                    split(cards, leftover, is_any_of(","));
+                    vector<string> cards = clause.cards;
                     TerminalState* freed_terminal_state = (TerminalState*) round_state;
                     round_state = freed_terminal_state->previous_state;
                     delete freed_terminal_state;
@@ -155,7 +287,7 @@ void Runner::run()
                 }
                 case 'D':
                 {
-                    int delta = lexical_cast<int>(leftover);
+                    int delta = clause.value;
                     array<int, 2> deltas = { -1 * delta, -1 * delta };
                     deltas[active] = delta;
                     TerminalState* freed_terminal_state = (TerminalState*) round_state;
@@ -205,18 +337,25 @@ void Runner::run()
 }
 
 /**
- * Parses arguments corresponding to socket connection information.
+ * Parses arguments corresponding to connection information.
+ * Returns the transport followed by its host and port, socket path, or pipe descriptors.
  */
 vector<string> parse_args(int argc, char* argv[])
 {
     namespace opt = boost::program_options;
     string host = "localhost";
     int port;
+    string unix_path;
+    vector<int> pipe_fds;
+    bool binary = false;
 
     opt::options_description desc("Allowed options");
     desc.add_options()
         ("host,h", opt::value<string>(&host), "HOST")
-        ("port", opt::value<int>(&port)->required(), "PORT")
+        ("unix", opt::value<string>(&unix_path), "UNIX")
+        ("pipe", opt::value< vector<int> >(&pipe_fds)->multitoken(), "READ_FD WRITE_FD")
+        ("binary", opt::bool_switch(&binary), "BINARY")
+        ("port", opt::value<int>(&port), "PORT")
     ;
 
     opt::positional_options_description p;
@@ -225,7 +364,20 @@ vector<string> parse_args(int argc, char* argv[])
     opt::variables_map vm;
     opt::store(opt::command_line_parser(argc, argv).options(desc).positional(p).run(), vm);
     opt::notify(vm);
-    return (vector<string>) { host, lexical_cast<string>(port) };
+    string protocol = binary ? "binary" : "text";
+    if (pipe_fds.size() == 2)
+    {
+        return (vector<string>) { protocol, "pipe", lexical_cast<string>(pipe_fds[0]), lexical_cast<string>(pipe_fds[1]) };
+    }
+    if (vm.count("unix"))
+    {
+        return (vector<string>) { protocol, "unix", unix_path };
+    }
+    if (!vm.count("port"))
+    {
+        throw opt::required_option("port");
+    }
+    return (vector<string>) { protocol, "tcp", host, lexical_cast<string>(port) };
 }
 
 /**
@@ -233,8 +385,38 @@ vector<string> parse_args(int argc, char* argv[])
  */
 void run_bot(Bot* pokerbot, vector<string> args)
 {
-    string host = args[0];
-    string port = args[1];
+    bool binary = args[0] == "binary";
+    if (args[1] == "pipe")
+    {
+        // the engine passes pipes which we reopen through /dev/fd
+        ifstream in_stream("/dev/fd/" + args[2], std::ios::binary);
+        ofstream out_stream("/dev/fd/" + args[3], std::ios::binary);
+        if (!in_stream || !out_stream)
+        {
+            cout << "Could not open pipes " << args[2] << " " << args[3] << "\n";
+            return;
+        }
+        out_stream << "K\n" << std::flush;  // tell the engine we are ready
+        Runner runner(pokerbot, &in_stream, &out_stream, binary);
+        runner.run();
+        return;
+    }
+    if (args[1] == "unix")
+    {
+        // connect to the engine
+        stream_protocol::iostream stream;
+        stream.connect(stream_protocol::endpoint(args[2]));
+        if (!stream) {
+            cout << "Could not connect to " << args[2] << "\n";
+            return;
+        }
+        Runner runner(pokerbot, &stream, &stream, binary);
+        runner.run();
+        stream.close();
+        return;
+    }
+    string host = args[2];
+    string port = args[3];
     // connect to the engine
     tcp::iostream stream;
     stream.connect(host, port);
@@ -245,7 +427,7 @@ void run_bot(Bot* pokerbot, vector<string> args)
         cout << "Could not connect to " << host << ":" << port << "\n";
         return;
     }
-    Runner runner(pokerbot, &stream);
+    Runner runner(pokerbot, &stream, &stream, binary);
     runner.run();
     stream.close();
 }
\ No newline at end of file
@@ -2,6 +2,7 @@
 #define __SKELETON_RUNNER_HPP__
 
 #include <iostream>
+#include <fstream>
 #include <vector>
 #include <array>
 #include <string>
@@ -9,11 +10,16 @@
 #include <boost/algorithm/string.hpp>
 #include <boost/program_options.hpp>
 #include <boost/asio/ip/tcp.hpp>
+#include <boost/asio/local/stream_protocol.hpp>
 #include "actions.hpp"
 #include "states.hpp"
 #include "bot.hpp"
 
 using std::getline;
+using std::istream;
+using std::ostream;
+using std::ifstream;
+using std::ofstream;
 using std::vector;
 using std::array;
 using std::string;
@@ -23,6 +29,19 @@ using boost::algorithm::trim;
 using boost::split;
 using boost::is_any_of;
 using boost::asio::ip::tcp;
+using boost::asio::local::stream_protocol;
+
+
+/**
+ * One parsed clause of a message from the engine.
+ */
+struct Clause
+{
+    char kind;
+    int value;
+    float game_clock;
+    vector<string> cards;
+};
 
 
 /**
@@ -32,15 +51,27 @@ class Runner
 {
     private:
         Bot* pokerbot;
-        tcp::iostream* stream;
+        istream* in_stream;
+        ostream* out_stream;
+        bool binary;
+
+        /**
+         * Parses an incoming text message.
+         */
+        vector<Clause> receive_text();
+
+        /**
+         * Decodes an incoming length-prefixed binary message.
+         */
+        vector<Clause> receive_binary();
 
     public:
-        Runner(Bot* pokerbot, tcp::iostream* stream);
+        Runner(Bot* pokerbot, istream* in_stream, ostream* out_stream, bool binary);
 
         /**
          * Returns an incoming message from the engine.
          */
-        vector<string> receive();
+        vector<Clause> receive();
 
         /**
          * Encodes an action and sends it to the engine.
@@ -55,7 +86,8 @@ class Runner
 
 
 /**
- * Parses arguments corresponding to socket connection information.
+ * Parses arguments corresponding to connection information.
+ * Returns the protocol and the transport followed by its host and port, socket path, or pipe descriptors.
  */
 vector<string> parse_args(int argc, char* argv[]);
 
@@ -2,20 +2,37 @@
 6.176 MIT POKERBOTS GAME ENGINE
 DO NOT REMOVE, RENAME, OR EDIT THIS FILE
 '''
-from numpy.random import geometric
-from collections import namedtuple
-from threading import Thread
-from queue import Queue
+from numpy.random import RandomState
+import numpy.random
+import numpy as np
+from collections import namedtuple, deque
+from bisect import bisect_left
+from contextlib import redirect_stdout, redirect_stderr
+from functools import lru_cache, partial
+from threading import Thread, Lock
+import importlib
+import traceback
+import argparse
+import random
+import gzip
+import lzma
 import time
 import json
 import subprocess
+import tempfile
+import select
+import shutil
 import socket
+import struct
 import eval7
 import sys
 import os
 
 sys.path.append(os.getcwd())
 from config import *
+from handhistory import (HandHistoryWriter, LatencyWriter, read_hand_history, card_index, CARD_STRINGS,
+                         FOLD, CALL, CHECK, RAISE)
+from buildcache import BuildCache, snapshot
 
 FoldAction = namedtuple('FoldAction', [])
 CallAction = namedtuple('CallAction', [])
@@ -23,11 +40,32 @@ CheckAction = namedtuple('CheckAction', [])
 # we coalesce BetAction and RaiseAction for convenience
 RaiseAction = namedtuple('RaiseAction', ['amount'])
 TerminalState = namedtuple('TerminalState', ['deltas', 'previous_state'])
+# the sets of legal actions, shared by every RoundState
+CHECK_ACTIONS = frozenset([CheckAction])
+CHECK_RAISE_ACTIONS = frozenset([CheckAction, RaiseAction])
+FOLD_CALL_ACTIONS = frozenset([FoldAction, CallAction])
+FOLD_CALL_RAISE_ACTIONS = frozenset([FoldAction, CallAction, RaiseAction])
+NO_PIPS = (0, 0)
+BLIND_PIPS = (BIG_BLIND, BIG_BLIND)
+BLIND_STACKS = (STARTING_STACK - BIG_BLIND, STARTING_STACK - BIG_BLIND)
 
 STREET_NAMES = ['Flop', 'Turn', 'River']
+# two-sided 95% normal quantile for confidence intervals
+Z_95 = 1.959964
+# the rows of the response time summary, by street, -1 for acks and None for all queries
+LATENCY_ROWS = [(0, 'Pre-flop'), (3, 'Flop'), (4, 'Turn'), (5, 'River'), (-1, 'Ack'), (None, 'All')]
+LATENCY_ROW_INDICES = {street: row for row, (street, _) in enumerate(LATENCY_ROWS) if street is not None}
+LATENCY_ALL_ROW = len(LATENCY_ROWS) - 1
+# response time histogram bins, 100 per decade from 1 microsecond to 100 seconds, so percentiles are within 2.3%
+LATENCY_BIN_EDGES = list(np.logspace(-6, 2, 801))
 DECODE = {'F': FoldAction, 'C': CallAction, 'K': CheckAction, 'R': RaiseAction}
-CCARDS = lambda cards: ','.join(map(str, cards))
-PCARDS = lambda cards: '{} [{}]'.format(' '.join(map(str, cards)), ' '.join(map(str, map(PERM.get, cards))))
+HISTORY_CODES = {FoldAction: FOLD, CallAction: CALL, CheckAction: CHECK, RaiseAction: RAISE}
+HISTORY_ACTIONS = {code: action for action, code in HISTORY_CODES.items()}
+# cards are looked up by index, rank * 4 + suit, in CARD_STRINGS and the per-game tables built by Game
+CCARDS = lambda cards: ','.join([CARD_STRINGS[card.rank * 4 + card.suit] for card in cards])
+PCARDS = lambda cards, perm_strings: '{} [{}]'.format(
+    ' '.join([CARD_STRINGS[card.rank * 4 + card.suit] for card in cards]),
+    ' '.join([perm_strings[card.rank * 4 + card.suit] for card in cards]))
 PVALUE = lambda name, value: ', {} ({})'.format(name, value)
 STATUS = lambda players: ''.join([PVALUE(p.name, p.bankroll) for p in players])
 
@@ -43,6 +81,9 @@ STATUS = lambda players: ''.join([PVALUE(p.name, p.bankroll) for p in players])
 # B**,**,**,**,** the board cards in common format
 # O**,** the opponent's hand in common format
 # D### the player's bankroll delta from the round
+# N a new game over the same connection, for pokerbots with "new_game" in commands.json
+# I### the table id, first in every message and response over a multiplexed
+#      connection, for pokerbots with "multiplex" in commands.json
 # Q game over
 #
 # Clauses are separated by spaces
@@ -50,19 +91,392 @@ STATUS = lambda players: ''.join([PVALUE(p.name, p.bankroll) for p in players])
 # The engine expects a response of K at the end of the round as an ack,
 # otherwise a response which encodes the player's action
 # Action history is sent once, including the player's actions
+# If PIPELINE_ROUNDS is set, for pokerbots with "pipeline_rounds" in
+# commands.json the end of the round is not acked: its clauses are sent at the
+# start of the player's next message, before the P clause, or before Q after
+# the last round
+#
+# Binary encoding scheme, used instead if PROTOCOL is 'binary' and the
+# pokerbot lists 'binary' under "protocols" in commands.json:
+#
+# Each message is a big-endian uint16 payload length followed by clauses,
+# each an ASCII clause letter as above followed by a fixed-width payload:
+# T uint32 milliseconds on the game clock
+# P uint8, I R uint16, D int16
+# H and O two card bytes, B a uint8 card count followed by that many card bytes
+# F C K Q no payload
+# Cards are encoded as rank * 4 + suit, so 2c is 0 and As is 51
+# Responses are an action letter followed by a uint16 raise amount, 0 otherwise,
+# after an I clause over a multiplexed connection
+
+BINARY_CARD_CODES = {card: code for code, card in enumerate(CARD_STRINGS)}
+BINARY_RESPONSE = struct.Struct('>cH')
+MULTIPLEX_BINARY_RESPONSE = struct.Struct('>cHcH')
+QUIT_MESSAGES = {'text': 'Q\n', 'binary': b'\x00\x01Q'}
+# the transports this platform supports, which are offered to pokerbots in the order of TRANSPORTS
+AVAILABLE_TRANSPORTS = {'tcp'} | ({'unix', 'pipe'} if os.name == 'posix' else set())
+LOG_OPENERS = {'.gz': gzip.open, '.xz': lzma.open}
+LOG_SUFFIXES = {None: '', 'gzip': '.gz', 'lzma': '.xz'}
+OUTPUT_CHUNK_SIZE = 65536
+# the kernel's CPU clock of a whole process, as clock_getcpuclockid returns it on Linux
+PROCESS_CPU_CLOCK = lambda pid: (~pid << 3) | 2
+CPU_CLOCK_AVAILABLE = sys.platform.startswith('linux')
+
+
+def open_log(filename, mode):
+    '''
+    Opens a text log, compressed according to its file extension.
+    '''
+    opener = LOG_OPENERS.get(os.path.splitext(filename)[1], open)
+    return opener(filename, mode)
+
+
+class NullLog():
+    '''
+    Stands in for the game log when the English log is not written during the game.
+    '''
+    filename = None
+
+    def append(self, line):
+        '''
+        Discards one line of the game log.
+        '''
+
+    def close(self):
+        '''
+        Does nothing, as nothing was opened.
+        '''
 
 
-class RoundState(namedtuple('_RoundState', ['button', 'street', 'pips', 'stacks', 'hands', 'deck', 'previous_state'])):
+class PlayerLog():
+    '''
+    Streams a pokerbot's output to its log file as it arrives, keeping the first
+    PLAYER_LOG_SIZE_LIMIT bytes. Of the rest, only the last PLAYER_LOG_TAIL_SIZE bytes
+    are buffered, to be appended on closing, so memory stays bounded whatever the pokerbot prints.
+    '''
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.log_file = None
+        self.bytes_written = 0
+        self.bytes_omitted = 0
+        self.tail = deque()
+        self.tail_bytes = 0
+        self.closed = False
+        self.lock = Lock()
+
+    def write(self, data):
+        '''
+        Records output as bytes or, for in-process pokerbots, text.
+        '''
+        if isinstance(data, str):
+            data = data.encode()
+        with self.lock:
+            if self.closed:
+                return
+            if self.log_file is None:
+                self.log_file = open(self.filename, 'wb')
+            room = PLAYER_LOG_SIZE_LIMIT - self.bytes_written
+            if room > 0:
+                self.bytes_written += self.log_file.write(data[:room])
+                data = data[room:]
+            if data:
+                self.bytes_omitted += len(data)
+                if PLAYER_LOG_TAIL_SIZE > 0:
+                    self.tail.append(data)
+                    self.tail_bytes += len(data)
+                    while self.tail_bytes - len(self.tail[0]) >= PLAYER_LOG_TAIL_SIZE:
+                        self.tail_bytes -= len(self.tail.popleft())
+
+    def flush(self):
+        '''
+        Flushes the log file, if anything has been written.
+        '''
+        with self.lock:
+            if self.log_file is not None and not self.closed:
+                self.log_file.flush()
+
+    def close(self):
+        '''
+        Appends the buffered end of the output and closes the log file.
+        '''
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            if self.log_file is None:
+                self.log_file = open(self.filename, 'wb')
+            if self.tail:
+                tail = b''.join(self.tail)[-PLAYER_LOG_TAIL_SIZE:]
+                if self.bytes_omitted > len(tail):
+                    self.log_file.write('\n[{} bytes omitted]\n'.format(self.bytes_omitted - len(tail)).encode())
+                self.log_file.write(tail)
+            self.log_file.close()
+
+
+class GameLog():
+    '''
+    Streams game log lines to disk as they are recorded, so memory stays flat over any number of rounds.
+    '''
+
+    def __init__(self, name, compression=None):
+        self.filename = name + '.txt' + LOG_SUFFIXES[compression]
+        self.log_file = open_log(self.filename, 'wt')
+        self.separator = ''
+
+    def append(self, line):
+        '''
+        Records one line of the game log.
+        '''
+        self.log_file.write(self.separator + line)
+        self.separator = '\n'
+
+    def close(self):
+        '''
+        Flushes and closes the underlying file.
+        '''
+        self.log_file.close()
+
+
+class LatencyLog():
+    '''
+    Counts how long each query of a pokerbot took during one game, from encoding the message
+    to decoding the response, and the part of that spent in the engine rather than the pokerbot.
+    Times are counted in a fixed histogram for each row of LATENCY_ROWS, so memory does not grow
+    with the game, and each query is also streamed to the game's LatencyWriter if one is open.
+    '''
+
+    def __init__(self):
+        self.round_num = 0
+        self.counts = np.zeros((len(LATENCY_ROWS), len(LATENCY_BIN_EDGES) + 1), dtype=np.int64)
+        self.seconds = np.zeros(len(LATENCY_ROWS))
+        self.overhead = np.zeros(len(LATENCY_ROWS))
+        self.longest = np.zeros(len(LATENCY_ROWS))
+        self.writer = None
+        self.seed = None
+        self.player_num = None
+
+    def open(self, writer, seed, player_num):
+        '''
+        Streams every later query to a LatencyWriter as a record of the given game and player.
+        '''
+        self.writer = writer
+        self.seed = seed
+        self.player_num = player_num
+
+    def record(self, street, seconds, overhead):
+        '''
+        Records one query of the current round, on a street or, if street is None, at its end.
+        '''
+        street = -1 if street is None else street
+        bin_num = bisect_left(LATENCY_BIN_EDGES, seconds)
+        for row in (LATENCY_ROW_INDICES[street], LATENCY_ALL_ROW):
+            self.counts[row, bin_num] += 1
+            self.seconds[row] += seconds
+            self.overhead[row] += overhead
+            self.longest[row] = max(self.longest[row], seconds)
+        if self.writer is not None:
+            self.writer.record(self.seed, self.round_num, self.player_num, street, seconds, overhead)
+
+    def summary(self, name):
+        '''
+        Returns lines reporting the response time percentiles in milliseconds and the share of engine overhead.
+        Each percentile is the upper edge of the histogram bin holding it, or the longest time if that is shorter.
+        '''
+        if not self.counts[LATENCY_ALL_ROW].any():
+            return [name + ' responded to no queries']
+        upper_edges = np.append(LATENCY_BIN_EDGES, np.inf)
+        lines = ['{} response times (ms)     n     p50     p95     p99     max  overhead'.format(name)]
+        for row, (_, row_name) in enumerate(LATENCY_ROWS):
+            count = self.counts[row].sum()
+            if count == 0:
+                continue
+            ranks = np.maximum(np.ceil(np.array([0.5, 0.95, 0.99]) * count), 1)
+            bins = np.searchsorted(np.cumsum(self.counts[row]), ranks)
+            p50, p95, p99 = np.minimum(upper_edges[bins], self.longest[row]) * 1000
+            share = self.overhead[row] / self.seconds[row] if self.seconds[row] > 0 else 0.
+            lines.append('  {:<18} {:>7} {:7.3f} {:7.3f} {:7.3f} {:7.3f} {:8.1%}'.format(
+                row_name, count, p50, p95, p99, self.longest[row] * 1000, share))
+        return lines
+
+
+def process_tree_cpu_time(pid):
+    '''
+    Returns the CPU seconds used so far by every thread of a process and its descendants,
+    read from the kernel's per-process CPU clocks. Processes which have exited are skipped.
+    '''
+    total = 0.
+    pids = [pid]
+    while pids:
+        pid = pids.pop()
+        try:
+            total += time.clock_gettime(PROCESS_CPU_CLOCK(pid))
+            for task in os.listdir('/proc/{}/task'.format(pid)):
+                with open('/proc/{}/task/{}/children'.format(pid, task), 'r') as children_file:
+                    pids.extend(int(child) for child in children_file.read().split())
+        except OSError:
+            pass
+    return total
+
+
+def cpu_clock(pid):
+    '''
+    Returns the clock which charges a pokerbot's queries to its game clock: the CPU time of
+    the process tree rooted at pid if GAME_CLOCK_MODE is 'cpu', and wall time otherwise.
+    '''
+    if GAME_CLOCK_MODE == 'cpu':
+        if CPU_CLOCK_AVAILABLE:
+            return partial(process_tree_cpu_time, pid)
+        print('CPU game clocks need Linux, charging wall time instead')
+    return time.perf_counter
+
+
+@lru_cache(maxsize=4096)
+def encode_binary_clause(clause):
+    '''
+    Encodes one text protocol clause in the binary protocol.
+    '''
+    kind = clause[0]
+    if kind in 'HO':
+        return kind.encode() + bytes(BINARY_CARD_CODES[card] for card in clause[1:].split(','))
+    if kind == 'B':
+        cards = clause[1:].split(',')
+        return b'B' + bytes([len(cards)] + [BINARY_CARD_CODES[card] for card in cards])
+    if kind == 'P':
+        return struct.pack('>cB', b'P', int(clause[1:]))
+    if kind == 'R':
+        return struct.pack('>cH', b'R', int(clause[1:]))
+    if kind == 'D':
+        return struct.pack('>ch', b'D', int(clause[1:]))
+    return kind.encode()
+
+
+def encode_binary_message(game_clock, player_message, table_id=None):
+    '''
+    Encodes a player message in the binary protocol, skipping its clock placeholder.
+    The message starts with an I clause if a table id is given.
+    '''
+    prefix = [] if table_id is None else [struct.pack('>cH', b'I', table_id)]
+    payload = b''.join(prefix + [struct.pack('>cI', b'T', int(round(game_clock * 1000)))] +
+                       [encode_binary_clause(clause) for clause in player_message[1:]])
+    return struct.pack('>H', len(payload)) + payload
+
+
+def decode_binary_response(data):
+    '''
+    Decodes a binary protocol response into the equivalent text protocol clause.
+    '''
+    if len(data) < BINARY_RESPONSE.size:
+        return ''
+    code, amount = BINARY_RESPONSE.unpack(data)
+    code = code.decode()
+    return code + str(amount) if code == 'R' else code
+
+
+class PipeFile():
+    '''
+    A connection over a pair of pipes, with the read timeouts of a socket file.
+    Text is written unless binary is set, in which case bytes are written.
+    '''
+
+    def __init__(self, read_fd, write_fd, timeout, binary=False):
+        self.read_fd = read_fd
+        self.write_fd = write_fd
+        self.timeout = timeout
+        self.binary = binary
+        self.read_buffer = b''
+        self.write_buffer = []
+
+    def write(self, data):
+        '''
+        Buffers outgoing data until the next flush.
+        '''
+        self.write_buffer.append(data)
+
+    def flush(self):
+        '''
+        Writes all buffered data to the pipe.
+        '''
+        data = b''.join(self.write_buffer) if self.binary else ''.join(self.write_buffer).encode()
+        self.write_buffer = []
+        while data:
+            data = data[os.write(self.write_fd, data):]
+
+    def fill(self, done):
+        '''
+        Reads from the pipe until done(read_buffer) holds or the pipe is closed.
+        Raises socket.timeout if no data arrives in time.
+        '''
+        while not done(self.read_buffer):
+            if not select.select([self.read_fd], [], [], self.timeout)[0]:
+                raise socket.timeout
+            chunk = os.read(self.read_fd, 4096)
+            if not chunk:
+                break
+            self.read_buffer += chunk
+
+    def read(self, size):
+        '''
+        Returns the next size bytes, or fewer once the pipe is closed.
+        '''
+        self.fill(lambda read_buffer: len(read_buffer) >= size)
+        data, self.read_buffer = self.read_buffer[:size], self.read_buffer[size:]
+        return data
+
+    def readline(self):
+        '''
+        Returns the next line, or an empty string once the pipe is closed.
+        '''
+        self.fill(lambda read_buffer: b'\n' in read_buffer)
+        line, separator, self.read_buffer = self.read_buffer.partition(b'\n')
+        return (line + separator).decode()
+
+    def close(self):
+        '''
+        Flushes any buffered text and closes both pipes.
+        '''
+        try:
+            self.flush()
+        finally:
+            os.close(self.read_fd)
+            os.close(self.write_fd)
+
+
+class PermutedDeck(eval7.Deck):
+    '''
+    A deck which carries its game's permuted card for each card index, so that
+    games with different value permutations can be played side by side.
+    '''
+
+    def __init__(self, perm_cards):
+        super().__init__()
+        self.perm_cards = perm_cards
+
+
+class RoundState():
     '''
     Encodes the game tree for one round of poker.
+    Pips and stacks are pairs which are never copied, only rebuilt on a change.
     '''
+    __slots__ = ['button', 'street', 'pips', 'stacks', 'hands', 'deck', 'previous_state']
+
+    def __init__(self, button, street, pips, stacks, hands, deck, previous_state):
+        self.button = button
+        self.street = street
+        self.pips = pips
+        self.stacks = stacks
+        self.hands = hands
+        self.deck = deck
+        self.previous_state = previous_state
 
     def showdown(self):
         '''
         Compares the players' hands and computes payoffs.
         '''
-        score0 = eval7.evaluate(list(map(PERM.get, self.deck.peek(5) + self.hands[0])))
-        score1 = eval7.evaluate(list(map(PERM.get, self.deck.peek(5) + self.hands[1])))
+        perm_cards = self.deck.perm_cards
+        board = [perm_cards[card.rank * 4 + card.suit] for card in self.deck.peek(5)]
+        score0 = eval7.evaluate(board + [perm_cards[card.rank * 4 + card.suit] for card in self.hands[0]])
+        score1 = eval7.evaluate(board + [perm_cards[card.rank * 4 + card.suit] for card in self.hands[1]])
         if score0 > score1:
             delta = STARTING_STACK - self.stacks[1]
         elif score0 < score1:
@@ -74,27 +488,34 @@ class RoundState(namedtuple('_RoundState', ['button', 'street', 'pips', 'stacks'
     def legal_actions(self):
         '''
         Returns a set which corresponds to the active player's legal moves.
+        The set is shared between states and must not be modified.
         '''
-        active = self.button % 2
+        active = self.button & 1
+        stacks = self.stacks
         continue_cost = self.pips[1-active] - self.pips[active]
         if continue_cost == 0:
             # we can only raise the stakes if both players can afford it
-            bets_forbidden = (self.stacks[0] == 0 or self.stacks[1] == 0)
-            return {CheckAction} if bets_forbidden else {CheckAction, RaiseAction}
+            return CHECK_ACTIONS if stacks[0] == 0 or stacks[1] == 0 else CHECK_RAISE_ACTIONS
         # continue_cost > 0
         # similarly, re-raising is only allowed if both players can afford it
-        raises_forbidden = (continue_cost == self.stacks[active] or self.stacks[1-active] == 0)
-        return {FoldAction, CallAction} if raises_forbidden else {FoldAction, CallAction, RaiseAction}
+        return FOLD_CALL_ACTIONS if continue_cost == stacks[active] or stacks[1-active] == 0 else FOLD_CALL_RAISE_ACTIONS
 
     def raise_bounds(self):
         '''
         Returns a tuple of the minimum and maximum legal raises.
         '''
-        active = self.button % 2
-        continue_cost = self.pips[1-active] - self.pips[active]
-        max_contribution = min(self.stacks[active], self.stacks[1-active] + continue_cost)
-        min_contribution = min(max_contribution, continue_cost + max(continue_cost, BIG_BLIND))
-        return (self.pips[active] + min_contribution, self.pips[active] + max_contribution)
+        active = self.button & 1
+        stacks = self.stacks
+        pip = self.pips[active]
+        continue_cost = self.pips[1-active] - pip
+        # min and max inlined, as this runs on every query
+        max_contribution = stacks[1-active] + continue_cost
+        if stacks[active] < max_contribution:
+            max_contribution = stacks[active]
+        min_contribution = continue_cost + (continue_cost if continue_cost > BIG_BLIND else BIG_BLIND)
+        if max_contribution < min_contribution:
+            min_contribution = max_contribution
+        return (pip + min_contribution, pip + max_contribution)
 
     def proceed_street(self):
         '''
@@ -103,39 +524,43 @@ class RoundState(namedtuple('_RoundState', ['button', 'street', 'pips', 'stacks'
         if self.street == 5:
             return self.showdown()
         new_street = 3 if self.street == 0 else self.street + 1
-        return RoundState(1, new_street, [0, 0], self.stacks, self.hands, self.deck, self)
+        return RoundState(1, new_street, NO_PIPS, self.stacks, self.hands, self.deck, self)
 
     def proceed(self, action):
         '''
         Advances the game tree by one action performed by the active player.
         '''
-        active = self.button % 2
-        if isinstance(action, FoldAction):
-            delta = self.stacks[0] - STARTING_STACK if active == 0 else STARTING_STACK - self.stacks[1]
+        action_type = type(action)
+        button = self.button
+        stack0, stack1 = self.stacks
+        if action_type is FoldAction:
+            delta = stack0 - STARTING_STACK if button & 1 == 0 else STARTING_STACK - stack1
             return TerminalState([delta, -delta], self)
-        if isinstance(action, CallAction):
-            if self.button == 0:  # sb calls bb
-                return RoundState(1, 0, [BIG_BLIND] * 2, [STARTING_STACK - BIG_BLIND] * 2, self.hands, self.deck, self)
+        if action_type is CallAction:
+            if button == 0:  # sb calls bb
+                return RoundState(1, 0, BLIND_PIPS, BLIND_STACKS, self.hands, self.deck, self)
             # both players acted
-            new_pips = list(self.pips)
-            new_stacks = list(self.stacks)
-            contribution = new_pips[1-active] - new_pips[active]
-            new_stacks[active] -= contribution
-            new_pips[active] += contribution
-            state = RoundState(self.button + 1, self.street, new_pips, new_stacks, self.hands, self.deck, self)
+            pip0, pip1 = self.pips
+            if button & 1 == 0:
+                state = RoundState(button + 1, self.street, (pip1, pip1), (stack0 - pip1 + pip0, stack1),
+                                   self.hands, self.deck, self)
+            else:
+                state = RoundState(button + 1, self.street, (pip0, pip0), (stack0, stack1 - pip0 + pip1),
+                                   self.hands, self.deck, self)
             return state.proceed_street()
-        if isinstance(action, CheckAction):
-            if (self.street == 0 and self.button > 0) or self.button > 1:  # both players acted
+        if action_type is CheckAction:
+            if (self.street == 0 and button > 0) or button > 1:  # both players acted
                 return self.proceed_street()
             # let opponent act
-            return RoundState(self.button + 1, self.street, self.pips, self.stacks, self.hands, self.deck, self)
-        # isinstance(action, RaiseAction)
-        new_pips = list(self.pips)
-        new_stacks = list(self.stacks)
-        contribution = action.amount - new_pips[active]
-        new_stacks[active] -= contribution
-        new_pips[active] += contribution
-        return RoundState(self.button + 1, self.street, new_pips, new_stacks, self.hands, self.deck, self)
+            return RoundState(button + 1, self.street, self.pips, self.stacks, self.hands, self.deck, self)
+        # action_type is RaiseAction
+        amount = action.amount
+        pip0, pip1 = self.pips
+        if button & 1 == 0:
+            return RoundState(button + 1, self.street, (amount, pip1), (stack0 - amount + pip0, stack1),
+                              self.hands, self.deck, self)
+        return RoundState(button + 1, self.street, (pip0, amount), (stack0, stack1 - amount + pip1),
+                          self.hands, self.deck, self)
 
 
 class Player():
@@ -143,19 +568,26 @@ class Player():
     Handles subprocess and socket interactions with one player's pokerbot.
     '''
 
-    def __init__(self, name, path):
+    def __init__(self, name, path, log_dir=''):
         self.name = name
         self.path = path
+        self.log_dir = log_dir
         self.game_clock = STARTING_GAME_CLOCK
         self.bankroll = 0
         self.commands = None
         self.bot_subprocess = None
         self.socketfile = None
-        self.bytes_queue = Queue()
+        self.protocol = 'text'
+        self.pending = []
+        self.games_started = 0
+        self.player_log = PlayerLog(os.path.join(log_dir, name + '.txt'))
+        self.timings = {}
+        self.latency = LatencyLog()
+        self.charge_clock = time.perf_counter
 
-    def build(self):
+    def load_commands(self):
         '''
-        Loads the commands file and builds the pokerbot.
+        Loads the commands file.
         '''
         try:
             with open(self.path + '/commands.json', 'r') as json_file:
@@ -170,66 +602,196 @@ class Player():
             print(self.name, 'commands.json not found - check PLAYER_PATH')
         except json.decoder.JSONDecodeError:
             print(self.name, 'commands.json misformatted')
+
+    def load(self):
+        '''
+        Loads the commands file of a pokerbot which has already been built.
+        '''
+        self.load_commands()
+
+    def build(self):
+        '''
+        Loads the commands file and builds the pokerbot.
+        '''
+        self.load_commands()
         if self.commands is not None and len(self.commands['build']) > 0:
+            build_cache = None
+            if BUILD_CACHE_DIR is not None:
+                try:
+                    build_cache = BuildCache(BUILD_CACHE_DIR)
+                    build_time = build_cache.restore(self.path)
+                    if build_time is not None:
+                        print(self.name, 'build cache hit, saved {:.2f}s'.format(build_time))
+                        return
+                    print(self.name, 'build cache miss')
+                    before = snapshot(self.path)
+                except OSError:
+                    print(self.name, 'build cache unavailable')
+                    build_cache = None
             try:
+                start = time.perf_counter()
                 proc = subprocess.run(self.commands['build'],
                                       stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
                                       cwd=self.path, timeout=BUILD_TIMEOUT, check=False)
-                self.bytes_queue.put(proc.stdout)
+                build_time = time.perf_counter() - start
+                self.player_log.write(proc.stdout)
+                if build_cache is not None and proc.returncode == 0:
+                    try:
+                        build_cache.store(self.path, before, build_time)
+                    except OSError:
+                        print(self.name, 'build could not be cached')
             except subprocess.TimeoutExpired as timeout_expired:
                 print('Timed out waiting for', self.name, 'to build')
-                self.bytes_queue.put(timeout_expired.stdout)
+                self.player_log.write(timeout_expired.stdout or b'')
             except (TypeError, ValueError):
                 print(self.name, 'build command misformatted')
             except OSError:
                 print(self.name, 'build failed - check "build" in commands.json')
 
+    def launch(self, args, pass_fds=()):
+        '''
+        Starts the pokerbot with the given connection arguments and captures its output.
+        '''
+        if self.protocol == 'binary':
+            args = args + ['--binary']
+        proc = subprocess.Popen(self.commands['run'] + args,
+                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                cwd=self.path, pass_fds=pass_fds)
+        self.bot_subprocess = proc
+        self.charge_clock = cpu_clock(proc.pid)
+        # function for bot listening, which reads in bounded chunks however long the lines
+        def stream_output(out, player_log):
+            try:
+                for chunk in iter(lambda: out.read1(OUTPUT_CHUNK_SIZE), b''):
+                    player_log.write(chunk)
+            except (ValueError, OSError):
+                pass
+        # start a separate bot listening thread which dies with the program
+        self.output_thread = Thread(target=stream_output, args=(proc.stdout, self.player_log), daemon=True)
+        self.output_thread.start()
+
+    def accept(self, server_socket, args):
+        '''
+        Launches the pokerbot and waits for it to connect to the listening socket.
+        '''
+        server_socket.settimeout(CONNECT_TIMEOUT)
+        server_socket.listen()
+        self.launch(args)
+        # block until we timeout or the player connects
+        client_socket, _ = server_socket.accept()
+        with client_socket:
+            client_socket.settimeout(CONNECT_TIMEOUT)
+            if client_socket.family == socket.AF_INET:
+                client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock = client_socket.makefile('rwb' if self.protocol == 'binary' else 'rw')
+            self.socketfile = sock
+            print(self.name, 'connected successfully')
+
+    def connect_pipe(self):
+        '''
+        Launches the pokerbot with inherited pipes and waits for it to ack that it is ready.
+        '''
+        engine_read, bot_write = os.pipe()
+        bot_read, engine_write = os.pipe()
+        try:
+            self.launch(['--pipe', str(bot_read), str(bot_write)], (bot_read, bot_write))
+        finally:
+            os.close(bot_read)
+            os.close(bot_write)
+        pipefile = PipeFile(engine_read, engine_write, CONNECT_TIMEOUT, self.protocol == 'binary')
+        try:
+            if not pipefile.readline():
+                raise BrokenPipeError
+        except OSError:
+            pipefile.close()
+            raise
+        self.socketfile = pipefile
+        print(self.name, 'connected successfully')
+
     def run(self):
         '''
-        Runs the pokerbot and establishes the socket connection.
+        Runs the pokerbot and establishes the connection over the first transport in TRANSPORTS
+        which the pokerbot lists in commands.json, or over TCP if it lists none.
+        The binary protocol is used if PROTOCOL asks for it and the pokerbot lists it.
         '''
         if self.commands is not None and len(self.commands['run']) > 0:
+            if PROTOCOL == 'binary' and 'binary' in self.commands.get('protocols', ['text']):
+                self.protocol = 'binary'
+
+            bot_transports = self.commands.get('transports', ['tcp'])
+            transport = next((transport for transport in TRANSPORTS
+                              if transport in bot_transports and transport in AVAILABLE_TRANSPORTS), 'tcp')
             try:
-                server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                with server_socket:
-                    server_socket.bind(('', 0))
-                    server_socket.settimeout(CONNECT_TIMEOUT)
-                    server_socket.listen()
-                    port = server_socket.getsockname()[1]
-                    proc = subprocess.Popen(self.commands['run'] + [str(port)],
-                                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
-                                            cwd=self.path)
-                    self.bot_subprocess = proc
-                    # function for bot listening
-                    def enqueue_output(out, queue):
-                        try:
-                            for line in out:
-                                queue.put(line)
-                        except ValueError:
-                            pass
-                    # start a separate bot listening thread which dies with the program
-                    Thread(target=enqueue_output, args=(proc.stdout, self.bytes_queue), daemon=True).start()
-                    # block until we timeout or the player connects
-                    client_socket, _ = server_socket.accept()
-                    with client_socket:
-                        client_socket.settimeout(CONNECT_TIMEOUT)
-                        sock = client_socket.makefile('rw')
-                        self.socketfile = sock
-                        print(self.name, 'connected successfully')
+                if transport == 'pipe':
+                    self.connect_pipe()
+                elif transport == 'unix':
+                    socket_dir = tempfile.mkdtemp()
+                    socket_path = os.path.join(socket_dir, 'engine.sock')
+                    try:
+                        server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                        with server_socket:
+                            server_socket.bind(socket_path)
+                            self.accept(server_socket, ['--unix', socket_path])
+                    finally:
+                        shutil.rmtree(socket_dir, ignore_errors=True)
+                else:
+                    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                    with server_socket:
+                        server_socket.bind(('', 0))
+                        port = server_socket.getsockname()[1]
+                        self.accept(server_socket, [str(port)])
             except (TypeError, ValueError):
                 print(self.name, 'run command misformatted')
+            except socket.timeout:  # a subclass of OSError
+                print('Timed out waiting for', self.name, 'to connect')
             except OSError:
                 print(self.name, 'run failed - check "run" in commands.json')
-            except socket.timeout:
-                print('Timed out waiting for', self.name, 'to connect')
+
+    def timed(self, phase, method):
+        '''
+        Calls one lifecycle method of the player and records how many seconds it took under phase.
+        '''
+        start_time = time.perf_counter()
+        method()
+        self.timings[phase] = time.perf_counter() - start_time
+
+    def new_game(self):
+        '''
+        Resets the game clock and bankroll before each game.
+        Later games over the same connection start with an N clause.
+        '''
+        if self.games_started > 0:
+            self.pending.append('N')
+        self.games_started += 1
+        self.game_clock = STARTING_GAME_CLOCK
+        self.bankroll = 0
+        self.latency = LatencyLog()
+
+    def reusable(self):
+        '''
+        Returns whether the pokerbot can play another game over its current connection.
+        '''
+        return (self.connected() and self.game_clock > 0. and
+                self.commands is not None and self.commands.get('new_game') is True)
+
+    def pipelines_rounds(self):
+        '''
+        Returns whether the end of each round is sent with the pokerbot's next message instead of being acked.
+        '''
+        return (PIPELINE_ROUNDS and
+                self.commands is not None and self.commands.get('pipeline_rounds') is True)
 
     def stop(self):
         '''
         Closes the socket connection and stops the pokerbot.
+        Any pending clauses from the last round are sent along with Q.
         '''
         if self.socketfile is not None:
             try:
-                self.socketfile.write('Q\n')
+                if self.pending and self.game_clock > 0.:
+                    self.socketfile.write(self.encode_message(['T0.'] + self.pending + ['Q']))
+                else:
+                    self.socketfile.write(QUIT_MESSAGES[self.protocol])
                 self.socketfile.close()
             except socket.timeout:
                 print('Timed out waiting for', self.name, 'to disconnect')
@@ -238,92 +800,342 @@ class Player():
         if self.bot_subprocess is not None:
             try:
                 outs, _ = self.bot_subprocess.communicate(timeout=CONNECT_TIMEOUT)
-                self.bytes_queue.put(outs)
+                self.player_log.write(outs)
             except subprocess.TimeoutExpired:
                 print('Timed out waiting for', self.name, 'to quit')
                 self.bot_subprocess.kill()
                 outs, _ = self.bot_subprocess.communicate()
-                self.bytes_queue.put(outs)
-        with open(self.name + '.txt', 'wb') as log_file:
-            bytes_written = 0
-            for output in self.bytes_queue.queue:
-                bytes_written += log_file.write(output)
-                if bytes_written >= PLAYER_LOG_SIZE_LIMIT:
-                    break
+                self.player_log.write(outs)
+            self.output_thread.join(CONNECT_TIMEOUT)
+        self.player_log.close()
+
+    def connected(self):
+        '''
+        Returns whether the pokerbot can currently be queried.
+        '''
+        return self.socketfile is not None
+
+    def send(self, message):
+        '''
+        Sends one message to the pokerbot.
+        '''
+        self.socketfile.write(message)
+        self.socketfile.flush()
+
+    def receive(self):
+        '''
+        Returns the pokerbot's response clause.
+        '''
+        if self.protocol == 'binary':
+            return decode_binary_response(self.socketfile.read(BINARY_RESPONSE.size))
+        return self.socketfile.readline().strip()
+
+    def encode_message(self, player_message):
+        '''
+        Encodes a player message, stamped with the current game clock, in the pokerbot's protocol.
+        '''
+        if self.protocol == 'binary':
+            return encode_binary_message(self.game_clock, player_message)
+        player_message[0] = 'T{:.3f}'.format(self.game_clock)
+        return ' '.join(player_message) + '\n'
 
     def query(self, round_state, player_message, game_log):
         '''
         Requests one action from the pokerbot over the socket connection.
         At the end of the round, we request a CheckAction from the pokerbot.
         '''
-        legal_actions = round_state.legal_actions() if isinstance(round_state, RoundState) else {CheckAction}
-        if self.socketfile is not None and self.game_clock > 0.:
+        legal_actions = round_state.legal_actions() if isinstance(round_state, RoundState) else CHECK_ACTIONS
+        if self.connected() and self.game_clock > 0.:
             try:
-                player_message[0] = 'T{:.3f}'.format(self.game_clock)
-                message = ' '.join(player_message) + '\n'
+                encode_time = time.perf_counter()
+                message = self.encode_message(player_message)
                 del player_message[1:]  # do not send redundant action history
-                start_time = time.perf_counter()
-                self.socketfile.write(message)
-                self.socketfile.flush()
-                clause = self.socketfile.readline().strip()
+                start_charge = self.charge_clock()
+                self.send(message)
+                sent_time = time.perf_counter()
+                clause = self.receive()
                 end_time = time.perf_counter()
                 if ENFORCE_GAME_CLOCK:
-                    self.game_clock -= end_time - start_time
+                    self.game_clock -= max(self.charge_clock() - start_charge, 0.)
                 if self.game_clock <= 0.:
                     raise socket.timeout
-                action = DECODE[clause[0]]
-                if action in legal_actions:
-                    if clause[0] == 'R':
-                        amount = int(clause[1:])
-                        min_raise, max_raise = round_state.raise_bounds()
-                        if min_raise <= amount <= max_raise:
-                            return action(amount)
-                    else:
-                        return action()
-                game_log.append(self.name + ' attempted illegal ' + action.__name__)
+                action = self.decode_action(clause, round_state, legal_actions, game_log)
+                decoded_time = time.perf_counter()
+                self.latency.record(getattr(round_state, 'street', None), decoded_time - encode_time,
+                                    (sent_time - encode_time) + (decoded_time - end_time))
+                if action is not None:
+                    return action
             except socket.timeout:
-                error_message = self.name + ' ran out of time'
-                game_log.append(error_message)
-                print(error_message)
-                self.game_clock = 0.
+                self.drop(self.name + ' ran out of time', game_log)
             except BrokenPipeError:
-                error_message = self.name + ' disconnected'
-                game_log.append(error_message)
-                print(error_message)
-                self.game_clock = 0.
+                self.drop(self.name + ' disconnected', game_log)
             except (IndexError, KeyError, ValueError):
                 game_log.append(self.name + ' response misformatted')
+        else:
+            del player_message[1:]  # the pokerbot will never receive it
         return CheckAction() if CheckAction in legal_actions else FoldAction()
 
+    def decode_action(self, clause, round_state, legal_actions, game_log):
+        '''
+        Returns the action encoded by a response clause, or None if it is illegal.
+        Raises IndexError, KeyError or ValueError if the clause is misformatted.
+        '''
+        action = DECODE[clause[0]]
+        if action in legal_actions:
+            if clause[0] == 'R':
+                amount = int(clause[1:])
+                min_raise, max_raise = round_state.raise_bounds()
+                if min_raise <= amount <= max_raise:
+                    return action(amount)
+            else:
+                return action()
+        game_log.append(self.name + ' attempted illegal ' + action.__name__)
+        return None
+
+    def drop(self, error_message, game_log):
+        '''
+        Reports an error after which the pokerbot is no longer queried this game.
+        '''
+        game_log.append(error_message)
+        print(error_message)
+        self.game_clock = 0.
+
+
+class LocalPlayer(Player):
+    '''
+    Runs one player's Python pokerbot inside the engine process, without sockets.
+    '''
+
+    def __init__(self, name, path, log_dir=''):
+        super().__init__(name, path, log_dir)
+        self.bot_module = None
+        self.runner_module = None
+        self.runner = None
+        self.message = None
+
+    def build(self):
+        '''
+        Loads the commands file, which says whether the pokerbot can play more than one game,
+        and imports the pokerbot's player.py and skeleton, isolated from any other pokerbot's modules.
+        '''
+        self.load_commands()
+        if not os.path.isfile(os.path.join(self.path, 'player.py')):
+            print(self.name, 'player.py not found - check PLAYER_PATH')
+            return
+        is_bot_module = lambda module_name: module_name == 'player' or module_name.split('.')[0] == 'skeleton'
+        shadowed = {module_name: sys.modules.pop(module_name) for module_name in list(sys.modules)
+                    if is_bot_module(module_name)}
+        bot_path = os.path.abspath(self.path)
+        sys.path.insert(0, bot_path)
+        try:
+            with redirect_stdout(self.player_log), redirect_stderr(self.player_log):
+                self.bot_module = importlib.import_module('player')
+                self.runner_module = importlib.import_module('skeleton.runner')
+        except Exception:  # pylint: disable=broad-except
+            self.player_log.write(traceback.format_exc())
+            print(self.name, 'import failed - check player.py')
+        finally:
+            sys.path.remove(bot_path)
+            for module_name in list(sys.modules):
+                if is_bot_module(module_name):
+                    del sys.modules[module_name]
+            sys.modules.update(shadowed)
+
+    def load(self):
+        '''
+        Imports the pokerbot, which is the whole of its build.
+        '''
+        self.build()
+
+    def run(self):
+        '''
+        Constructs the pokerbot and the runner which reconstructs its game tree.
+        '''
+        if self.runner_module is not None:
+            try:
+                start_time = time.perf_counter()
+                with redirect_stdout(self.player_log), redirect_stderr(self.player_log):
+                    pokerbot = self.bot_module.Player()
+                if time.perf_counter() - start_time > CONNECT_TIMEOUT:
+                    raise socket.timeout
+                if GAME_CLOCK_MODE == 'cpu':  # the pokerbot runs on the engine's thread
+                    self.charge_clock = time.thread_time
+                self.runner = self.runner_module.Runner(pokerbot, None)
+                print(self.name, 'connected successfully')
+            except socket.timeout:
+                print('Timed out waiting for', self.name, 'to connect')
+            except Exception:  # pylint: disable=broad-except
+                self.player_log.write(traceback.format_exc())
+                print(self.name, 'run failed - check player.py')
+
+    def stop(self):
+        '''
+        Ends the game for the pokerbot and writes its captured output.
+        Any pending clauses from the last round are handled along with Q.
+        '''
+        if self.runner is not None:
+            packet = [('Q', None)]
+            if self.pending and self.game_clock > 0.:
+                packet = self.runner.parse(self.encode_message(['T0.'] + self.pending + ['Q']))
+            try:
+                with redirect_stdout(self.player_log), redirect_stderr(self.player_log):
+                    self.runner.handle_packet(packet)
+            except Exception:  # pylint: disable=broad-except
+                self.player_log.write(traceback.format_exc())
+        self.player_log.close()
+
+    def connected(self):
+        '''
+        Returns whether the pokerbot can currently be queried.
+        '''
+        return self.runner is not None
+
+    def send(self, message):
+        '''
+        Holds one message for the pokerbot's runner, which handles it when the response is received.
+        '''
+        self.message = message
+
+    def receive(self):
+        '''
+        Hands the held message directly to the pokerbot's runner and returns its response clause.
+        A pokerbot which raises an exception is treated as disconnected.
+        '''
+        try:
+            with redirect_stdout(self.player_log), redirect_stderr(self.player_log):
+                action = self.runner.handle_packet(self.runner.parse(self.message))
+            return self.runner.encode(action)
+        except Exception:  # pylint: disable=broad-except
+            self.player_log.write(traceback.format_exc())
+            raise BrokenPipeError
+
+
+def call_in_order(functions):
+    '''
+    Calls each function in order.
+    '''
+    for function in functions:
+        function()
+
+
+def run_concurrently(functions):
+    '''
+    Calls each function in its own thread and waits for all of them to return.
+    In-process pokerbots share the engine's modules, output and generators, so with HEADLESS
+    the functions are called in order instead.
+    '''
+    if HEADLESS:
+        call_in_order(functions)
+        return
+    threads = [Thread(target=function) for function in functions]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def build_pokerbots(paths, log_dir=''):
+    '''
+    Builds each pokerbot directory once, each in its own thread, logging to <directory name>.txt in log_dir.
+    Processes which then launch pokerbots from these directories at the same time should launch
+    them with built=True, so that they do not build the same directory over each other.
+    '''
+    builders = {}
+    for path in paths:
+        name = os.path.basename(os.path.abspath(path))
+        names = [builder.name for builder in builders.values()]
+        if name in names:  # two versions of a pokerbot in directories with the same name
+            name = '{}_{}'.format(name, names.count(name) + 1)
+        builders.setdefault(os.path.abspath(path), Player(name, path, log_dir))
+    threads = [Thread(target=builder.build) for builder in builders.values()]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for builder in builders.values():
+        builder.player_log.close()
+
+
+def launch_players(player_paths, log_dir='', built=False):
+    '''
+    Builds and starts both players' pokerbots, each phase for both players at once.
+    A directory used by both players is built only by the first, before the second.
+    If built is True, the directories were built by build_pokerbots and are only loaded.
+    '''
+    player_class = LocalPlayer if HEADLESS else Player
+    players = [
+        player_class(PLAYER_1_NAME, player_paths[0], log_dir),
+        player_class(PLAYER_2_NAME, player_paths[1], log_dir)
+    ]
+    builds = {}
+    for player in players:
+        phase = player.load if built else player.build
+        builds.setdefault(os.path.abspath(player.path), []).append(partial(player.timed, 'build', phase))
+    run_concurrently([partial(call_in_order, calls) for calls in builds.values()])
+    run_concurrently([partial(player.timed, 'run', player.run) for player in players])
+    return players
+
+
+def stop_players(players):
+    '''
+    Stops both pokerbots at once and reports how long each phase of their lifecycles took.
+    '''
+    run_concurrently([partial(player.timed, 'stop', player.stop) for player in players])
+    for player in players:
+        print(player.name, 'timings:', ', '.join('{} {:.3f}s'.format(phase, seconds)
+                                                  for phase, seconds in player.timings.items()))
+
 
 class Game():
     '''
     Manages logging and the high-level game procedure.
     '''
 
-    def __init__(self):
+    def __init__(self, player_paths=(PLAYER_1_PATH, PLAYER_2_PATH), log_dir='', seed=SEED,
+                 log_name=GAME_LOG_FILENAME, log_mode=GAME_LOG_MODE, swap_seats=False, record_deltas=False):
+        self.player_paths = player_paths
+        self.log_dir = log_dir
+        self.log_name = log_name
+        self.log_mode = log_mode
+        # the English log is only formatted in text mode
+        self.text_log = log_mode == 'text'
+        self.seed = seed if seed is not None else random.SystemRandom().randrange(2 ** 32)
+        # with swapped seats, each player is dealt the other's cards of the same deals
+        self.swap_seats = swap_seats
+        # player 1's bankroll delta from each round, kept only for callers which compare games
+        self.deal_deltas = {} if record_deltas else None
         suits = ['c', 'd', 'h', 's']
         values = ['2', '3', '4', '5', '6', '7', '8', '9', 'T', 'J', 'Q', 'K', 'A']
         perm = [values[i] for i in self.permute_values()]
-        # create global permutation dictionary
-        global PERM
-        PERM = {eval7.Card(values[i % 13] + suits[i // 13]) :
-                eval7.Card(perm[i % 13] + suits[i // 13])
-                for i in range(52)}
-        self.log = ['6.176 MIT Pokerbots - ' + PLAYER_1_NAME + ' vs ' + PLAYER_2_NAME,
+        # create the game's permutation dictionary
+        self.perm = {eval7.Card(values[i % 13] + suits[i // 13]) :
+                     eval7.Card(perm[i % 13] + suits[i // 13])
+                     for i in range(52)}
+        self.perm_indices = [card_index(self.perm[card]) for card in eval7.Deck().cards]
+        # the permuted card and its string for each card index
+        self.perm_cards = [eval7.Card(CARD_STRINGS[i]) for i in self.perm_indices]
+        self.perm_strings = [CARD_STRINGS[i] for i in self.perm_indices]
+        self.log = None
+        self.hand_history = None
+        self.latency_writer = None
+        self.header = ['6.176 MIT Pokerbots - ' + PLAYER_1_NAME + ' vs ' + PLAYER_2_NAME,
+                    'Seed ' + str(self.seed),
                     '---------------------------',
                     ' ' + ' '.join(values) + ' ',
                     '[' + ' '.join(perm) + ']',
                     '---------------------------',]
+        if swap_seats:
+            self.header.insert(2, 'Seats swapped')
         self.player_messages = [[], []]
 
     def permute_values(self):
         '''
         Selects a value permutation for the whole game according the prior distribution.
+        The permutation is determined by the game's seed.
         '''
         orig_perm = list(range(13))[::-1]
         prop_perm = []
-        seed = geometric(p=0.25, size=13) - 1
+        seed = RandomState(self.seed).geometric(p=0.25, size=13) - 1
         for s in seed:
             pop_i = len(orig_perm) - 1 - (s % len(orig_perm))
             prop_perm.append(orig_perm.pop(pop_i))
@@ -334,17 +1146,20 @@ class Game():
         Incorporates RoundState information into the game log and player messages.
         '''
         if round_state.street == 0 and round_state.button == 0:
-            self.log.append('{} posts the blind of {}'.format(players[0].name, SMALL_BLIND))
-            self.log.append('{} posts the blind of {}'.format(players[1].name, BIG_BLIND))
-            self.log.append('{} dealt {}'.format(players[0].name, PCARDS(round_state.hands[0])))
-            self.log.append('{} dealt {}'.format(players[1].name, PCARDS(round_state.hands[1])))
-            self.player_messages[0] = ['T0.', 'P0', 'H' + CCARDS(round_state.hands[0])]
-            self.player_messages[1] = ['T0.', 'P1', 'H' + CCARDS(round_state.hands[1])]
+            if self.text_log:
+                self.log.append('{} posts the blind of {}'.format(players[0].name, SMALL_BLIND))
+                self.log.append('{} posts the blind of {}'.format(players[1].name, BIG_BLIND))
+                self.log.append('{} dealt {}'.format(players[0].name, PCARDS(round_state.hands[0], self.perm_strings)))
+                self.log.append('{} dealt {}'.format(players[1].name, PCARDS(round_state.hands[1], self.perm_strings)))
+            self.player_messages[0] = ['T0.'] + players[0].pending + ['P0', 'H' + CCARDS(round_state.hands[0])]
+            self.player_messages[1] = ['T0.'] + players[1].pending + ['P1', 'H' + CCARDS(round_state.hands[1])]
+            players[0].pending, players[1].pending = [], []
         elif round_state.street > 0 and round_state.button == 1:
             board = round_state.deck.peek(round_state.street)
-            self.log.append(STREET_NAMES[round_state.street - 3] + ' ' + PCARDS(board) +
-                            PVALUE(players[0].name, STARTING_STACK-round_state.stacks[0]) +
-                            PVALUE(players[1].name, STARTING_STACK-round_state.stacks[1]))
+            if self.text_log:
+                self.log.append(STREET_NAMES[round_state.street - 3] + ' ' + PCARDS(board, self.perm_strings) +
+                                PVALUE(players[0].name, STARTING_STACK-round_state.stacks[0]) +
+                                PVALUE(players[1].name, STARTING_STACK-round_state.stacks[1]))
             compressed_board = 'B' + CCARDS(board)
             self.player_messages[0].append(compressed_board)
             self.player_messages[1].append(compressed_board)
@@ -363,9 +1178,10 @@ class Game():
             phrasing = ' checks'
             code = 'K'
         else:  # isinstance(action, RaiseAction)
-            phrasing = (' bets ' if bet_override else ' raises to ') + str(action.amount)
             code = 'R' + str(action.amount)
-        self.log.append(name + phrasing)
+            phrasing = (' bets ' if bet_override else ' raises to ') + code[1:]
+        if self.text_log:
+            self.log.append(name + phrasing)
         self.player_messages[0].append(code)
         self.player_messages[1].append(code)
 
@@ -375,41 +1191,152 @@ class Game():
         '''
         previous_state = round_state.previous_state
         if FoldAction not in previous_state.legal_actions():
-            self.log.append('{} shows {}'.format(players[0].name, PCARDS(previous_state.hands[0])))
-            self.log.append('{} shows {}'.format(players[1].name, PCARDS(previous_state.hands[1])))
+            if self.text_log:
+                self.log.append('{} shows {}'.format(players[0].name, PCARDS(previous_state.hands[0], self.perm_strings)))
+                self.log.append('{} shows {}'.format(players[1].name, PCARDS(previous_state.hands[1], self.perm_strings)))
             self.player_messages[0].append('O' + CCARDS(previous_state.hands[1]))
             self.player_messages[1].append('O' + CCARDS(previous_state.hands[0]))
-        self.log.append('{} awarded {}'.format(players[0].name, round_state.deltas[0]))
-        self.log.append('{} awarded {}'.format(players[1].name, round_state.deltas[1]))
+        if self.text_log:
+            self.log.append('{} awarded {}'.format(players[0].name, round_state.deltas[0]))
+            self.log.append('{} awarded {}'.format(players[1].name, round_state.deltas[1]))
         self.player_messages[0].append('D' + str(round_state.deltas[0]))
         self.player_messages[1].append('D' + str(round_state.deltas[1]))
 
-    def run_round(self, players):
+    def shuffled_deck(self, round_num):
         '''
-        Runs one round of poker.
+        Returns the deck for one round, determined by the game's seed and the round number alone
+        so that any round can be replayed without replaying the rounds before it.
         '''
-        deck = eval7.Deck()
-        deck.shuffle()
+        deck = PermutedDeck(self.perm_cards)
+        random.Random('{}-{}'.format(self.seed, round_num)).shuffle(deck.cards)
+        return deck
+
+    def deal_round(self, round_num):
+        '''
+        Returns the starting RoundState of a round.
+        '''
+        deck = self.shuffled_deck(round_num)
         hands = [deck.deal(2), deck.deal(2)]
-        pips = [SMALL_BLIND, BIG_BLIND]
-        stacks = [STARTING_STACK - SMALL_BLIND, STARTING_STACK - BIG_BLIND]
-        round_state = RoundState(0, 0, pips, stacks, hands, deck, None)
+        pips = (SMALL_BLIND, BIG_BLIND)
+        stacks = (STARTING_STACK - SMALL_BLIND, STARTING_STACK - BIG_BLIND)
+        return RoundState(0, 0, pips, stacks, hands, deck, None)
+
+    def apply_action(self, players, round_state, action, history):
+        '''
+        Logs and records the active player's action and returns the next state.
+        '''
+        active = round_state.button % 2
+        bet_override = (round_state.pips == NO_PIPS)
+        self.log_action(players[active].name, action, bet_override)
+        history.append((round_state.street, active, HISTORY_CODES[type(action)], getattr(action, 'amount', 0)))
+        return round_state.proceed(action)
+
+    def end_round(self, players, round_num, terminal_state, history):
+        '''
+        Logs and records the end of a round and settles the players' bankrolls.
+        Returns the players who must still ack the round, with their messages.
+        '''
+        self.log_terminal_state(players, terminal_state)
+        if self.hand_history is not None:
+            # player 1 posts the small blind in odd rounds, or in even rounds with swapped seats
+            small_blind = (0 if round_num % 2 == 1 else 1) ^ self.swap_seats
+            self.hand_history.record(self.seed, round_num, small_blind, self.perm_indices, terminal_state, history)
+        acks = []
+        for player, player_message, delta in zip(players, self.player_messages, terminal_state.deltas):
+            if player.pipelines_rounds():
+                player.pending = player_message[1:]
+            else:
+                acks.append((player, player_message))
+            player.bankroll += delta
+            if self.deal_deltas is not None and player.name == PLAYER_1_NAME:
+                self.deal_deltas[round_num] = delta
+        return acks
+
+    def run_round(self, players, round_num):
+        '''
+        Runs one round of poker.
+        '''
+        round_state = self.deal_round(round_num)
+        history = []
         while not isinstance(round_state, TerminalState):
             self.log_round_state(players, round_state)
             active = round_state.button % 2
-            player = players[active]
-            action = player.query(round_state, self.player_messages[active], self.log)
-            bet_override = (round_state.pips == [0, 0])
-            self.log_action(player.name, action, bet_override)
-            round_state = round_state.proceed(action)
-        self.log_terminal_state(players, round_state)
-        for player, player_message, delta in zip(players, self.player_messages, round_state.deltas):
+            action = players[active].query(round_state, self.player_messages[active], self.log)
+            round_state = self.apply_action(players, round_state, action, history)
+        for player, player_message in self.end_round(players, round_num, round_state, history):
             player.query(round_state, player_message, self.log)
-            player.bankroll += delta
 
-    def run(self):
+    def seatings(self, players, rounds=None):
+        '''
+        Yields the seated players and number of the given rounds, or every round,
+        logging the header, each round's status and the final status around them.
+        '''
+        for line in self.header:
+            self.log.append(line)
+        if self.swap_seats:
+            players = players[::-1]
+        seated = players
+        for round_num in (range(1, NUM_ROUNDS + 1) if rounds is None else rounds):
+            # the small blind alternates, so seats depend only on the round number
+            seated = players if round_num % 2 == 1 else players[::-1]
+            for player in players:
+                player.latency.round_num = round_num
+            if self.text_log:
+                self.log.append('')
+                self.log.append('Round #' + str(round_num) + STATUS(seated))
+            yield seated, round_num
+            seated = seated[::-1]
+        if self.text_log:
+            self.log.append('')
+            self.log.append('Final' + STATUS(seated))
+
+    def play(self, players, rounds=None):
+        '''
+        Plays the given rounds, or every round, into the open game log.
+        '''
+        for seated, round_num in self.seatings(players, rounds):
+            self.run_round(seated, round_num)
+
+    def open_logs(self, players):
+        '''
+        Opens the game log and, if they are written, the hand history and the players' response times.
         '''
-        Runs one game of poker.
+        if self.text_log:
+            self.log = GameLog(os.path.join(self.log_dir, self.log_name), GAME_LOG_COMPRESSION)
+            print('Writing', self.log.filename)
+        else:
+            self.log = NullLog()
+        if WRITE_HAND_HISTORY or self.log_mode == 'lazy':
+            self.hand_history = HandHistoryWriter(os.path.join(self.log_dir, self.log_name))
+        if WRITE_LATENCY_LOG:
+            self.latency_writer = LatencyWriter(os.path.join(self.log_dir, self.log_name))
+            for player_num, player in enumerate(players):
+                player.latency.open(self.latency_writer, self.seed, player_num)
+
+    def report_latency(self, players):
+        '''
+        Prints each player's response time percentiles.
+        '''
+        for player in players:
+            for line in player.latency.summary(player.name):
+                print(line)
+
+    def close_logs(self):
+        '''
+        Closes the game log, the hand history and the response times.
+        '''
+        self.log.close()
+        if self.hand_history is not None:
+            self.hand_history.close()
+        if self.latency_writer is not None:
+            self.latency_writer.close()
+
+    def run(self, rounds=None, players=None):
+        '''
+        Runs one game of poker and returns each player's final bankroll by name.
+        Only the given round numbers are played if rounds is not None.
+        If players is given, the game is played by those already running pokerbots,
+        which are left running afterwards, instead of newly launched ones.
         '''
         print('   __  _____________  ___       __           __        __    ')
         print('  /  |/  /  _/_  __/ / _ \\___  / /_____ ____/ /  ___  / /____')
@@ -417,27 +1344,206 @@ class Game():
         print('/_/  /_/___/ /_/   /_/   \\___/_/\\_\\\\__/_/ /_.__/\\___/\\__/___/')
         print()
         print('Starting the Pokerbots engine...')
-        players = [
-            Player(PLAYER_1_NAME, PLAYER_1_PATH),
-            Player(PLAYER_2_NAME, PLAYER_2_PATH)
-        ]
-        for player in players:
-            player.build()
-            player.run()
-        for round_num in range(1, NUM_ROUNDS + 1):
-            self.log.append('')
-            self.log.append('Round #' + str(round_num) + STATUS(players))
-            self.run_round(players)
-            players = players[::-1]
-        self.log.append('')
-        self.log.append('Final' + STATUS(players))
+        if HEADLESS:  # in-process pokerbots draw from the same generators as the engine
+            random.seed(self.seed)
+            numpy.random.seed(self.seed)
+        launched = players is None
+        if launched:
+            players = launch_players(self.player_paths, self.log_dir)
         for player in players:
-            player.stop()
-        name = GAME_LOG_FILENAME + '.txt'
-        print('Writing', name)
-        with open(name, 'w') as log_file:
-            log_file.write('\n'.join(self.log))
+            player.new_game()
+        self.open_logs(players)
+        try:
+            self.play(players, rounds)
+        finally:
+            self.close_logs()
+        self.report_latency(players)
+        if launched:
+            stop_players(players)
+        return {player.name: player.bankroll for player in players}
+
+
+def read_rounds(filename):
+    '''
+    Returns the seed of a game log, whether its seats were swapped and the lines of each of its rounds by round number.
+    '''
+    seed = None
+    swap_seats = False
+    rounds = {}
+    lines = None
+    with open_log(filename, 'rt') as log_file:
+        for line in log_file:
+            line = line.rstrip('\n')
+            if line.startswith('Seed ') and seed is None:
+                seed = int(line[5:])
+            elif line == 'Seats swapped' and not rounds:
+                swap_seats = True
+            elif line.startswith('Round #'):
+                lines = rounds[int(line[7:].split(',')[0])] = []
+            elif line == '' or line.startswith('Final'):
+                lines = None
+            elif lines is not None:
+                lines.append(line)
+    return seed, swap_seats, rounds
+
+
+def parse_rounds(spec):
+    '''
+    Parses a round selection such as 1,5-9 into a sorted list of round numbers.
+    '''
+    rounds = set()
+    for part in spec.split(','):
+        first, _, last = part.partition('-')
+        rounds.update(range(int(first), int(last or first) + 1))
+    return sorted(rounds)
+
+
+def replay(filename, rounds):
+    '''
+    Replays the deals of a logged game and reports which rounds played out differently.
+    '''
+    seed, swap_seats, logged_rounds = read_rounds(filename)
+    if seed is None:
+        print(filename, 'has no seed and cannot be replayed')
+        return
+    if rounds is None:
+        rounds = sorted(logged_rounds)
+    stem, extension = os.path.splitext(filename)
+    if extension in LOG_OPENERS:
+        stem = os.path.splitext(stem)[0]
+    replay_name = stem + '_replay'
+    game = Game(seed=seed, log_name=replay_name, log_mode='text', swap_seats=swap_seats)
+    game.run(rounds)
+    _, _, replayed_rounds = read_rounds(game.log.filename)
+    diverged = [round_num for round_num in rounds
+                if logged_rounds.get(round_num) != replayed_rounds.get(round_num)]
+    print('Replayed', len(rounds), 'rounds with seed', seed, '-', len(rounds) - len(diverged), 'identical')
+    for round_num in diverged:
+        logged = logged_rounds.get(round_num, [])
+        replayed = replayed_rounds.get(round_num, [])
+        line_num = next(i for i in range(max(len(logged), len(replayed)))
+                        if logged[i:i+1] != replayed[i:i+1])
+        print('Round #{} diverged: {!r} became {!r}'.format(
+            round_num, (logged[line_num:line_num+1] or [''])[0], (replayed[line_num:line_num+1] or [''])[0]))
+
+
+class ScriptedPlayer(Player):
+    '''
+    Plays back the recorded actions of a game, shared in order with the other ScriptedPlayer.
+    '''
+
+    def __init__(self, name, actions):
+        super().__init__(name, None)
+        self.actions = actions
+
+    def query(self, round_state, player_message, game_log):
+        '''
+        Returns the next recorded action, or an ack at the end of the round.
+        '''
+        del player_message[1:]
+        if not isinstance(round_state, RoundState):
+            return CheckAction()
+        return next(self.actions)
+
+
+def render(name):
+    '''
+    Renders the English game log of a game from its hand history, for games
+    played with GAME_LOG_MODE = 'lazy'. Notes about pokerbot errors are not recorded there.
+    '''
+    hands, actions, _ = read_hand_history(name)
+    if len(hands) == 0:
+        print(name, 'has no recorded rounds to render')
+        return
+    recorded = iter([HISTORY_ACTIONS[action](amount) if action == RAISE else HISTORY_ACTIONS[action]()
+                     for action, amount in zip(actions['action'].tolist(), actions['amount'].tolist())])
+    players = [ScriptedPlayer(PLAYER_1_NAME, recorded), ScriptedPlayer(PLAYER_2_NAME, recorded)]
+    # player 1 posts the small blind in odd rounds unless the seats were swapped
+    swap_seats = bool(hands['small_blind'][0] != (0 if hands['round_num'][0] % 2 == 1 else 1))
+    game = Game(seed=int(hands['seed'][0]), log_name=name, log_mode='text', swap_seats=swap_seats)
+    game.log = GameLog(name, GAME_LOG_COMPRESSION)
+    print('Writing', game.log.filename)
+    try:
+        game.play(players, hands['round_num'].tolist())
+    finally:
+        game.log.close()
+
+
+def duplicate_summary(pairs):
+    '''
+    Summarizes duplicate deals, given player 1's bankroll deltas from each deal as dealt and with seats swapped.
+    Returns lines reporting the mean combined result per deal with its 95% confidence interval, and how
+    much less the combined results vary than pairs of independent deals would.
+    '''
+    if len(pairs) < 2:
+        return ['Too few duplicate deals to summarize']
+    deltas = np.array(pairs, dtype=float)
+    combined = deltas.sum(axis=1)
+    mean = combined.mean()
+    half_width = Z_95 * combined.std(ddof=1) / np.sqrt(len(combined))
+    # two independent deals vary twice as much as one
+    unpaired_variance = 2 * deltas.var(ddof=1)
+    paired_variance = combined.var(ddof=1)
+    lines = ['Duplicate deals: {}, combined {} per deal {:.3f}, 95% confidence interval [{:.3f}, {:.3f}]'.format(
+        len(combined), PLAYER_1_NAME, mean, mean - half_width, mean + half_width)]
+    if paired_variance > 0:
+        lines.append('Variance per deal pair {:.1f} against {:.1f} unpaired, worth {:.2f}x as many unpaired deals'.format(
+            paired_variance, unpaired_variance, unpaired_variance / paired_variance))
+    return lines
+
+
+def duplicate(seed, rounds):
+    '''
+    Plays a duplicate match: a game, then the same permutation and decks with seats swapped, so that
+    each player is dealt both hands of every deal and the luck of the cards cancels out. The second
+    game is played by the same pokerbot processes if they support new games, and is logged to
+    GAME_LOG_FILENAME + '_swapped'.
+    '''
+    seed = seed if seed is not None else random.SystemRandom().randrange(2 ** 32)
+    player_paths = (PLAYER_1_PATH, PLAYER_2_PATH)
+    if HEADLESS:  # so that in-process pokerbots are constructed the same way in every duplicate match
+        random.seed(seed)
+        numpy.random.seed(seed)
+    players = launch_players(player_paths)
+    games = []
+    for swap_seats in (False, True):
+        if not all(player.reusable() for player in players):
+            stop_players(players)
+            players = launch_players(player_paths)
+        game = Game(player_paths, seed=seed, log_name=GAME_LOG_FILENAME + ('_swapped' if swap_seats else ''),
+                    swap_seats=swap_seats, record_deltas=True)
+        game.run(rounds, players)
+        games.append(game)
+    stop_players(players)
+    first, second = games[0].deal_deltas, games[1].deal_deltas
+    print()
+    for line in duplicate_summary([(first[round_num], second[round_num]) for round_num in sorted(first)
+                                   if round_num in second]):
+        print(line)
+
+
+def parse_args():
+    '''
+    Parses arguments controlling the seed, replays and rendering.
+    '''
+    parser = argparse.ArgumentParser(prog='python3 engine.py')
+    parser.add_argument('--seed', type=int, default=SEED, help='Seed for the permutation and every deck, defaults to SEED')
+    parser.add_argument('--replay', type=str, default=None, help='Game log whose deals are replayed')
+    parser.add_argument('--rounds', type=parse_rounds, default=None, help='Rounds to play, e.g. 1,5-9, defaults to all')
+    parser.add_argument('--duplicate', action='store_true',
+                        help='Play the game again with seats swapped and report the combined result of each deal')
+    parser.add_argument('--render', type=str, default=None, metavar='NAME',
+                        help='Hand history, e.g. gamelog, whose English game log is rendered')
+    return parser.parse_args()
 
 
 if __name__ == '__main__':
-    Game().run()
+    ARGS = parse_args()
+    if ARGS.replay is not None:
+        replay(ARGS.replay, ARGS.rounds)
+    elif ARGS.render is not None:
+        render(ARGS.render)
+    elif ARGS.duplicate:
+        duplicate(ARGS.seed, ARGS.rounds)
+    else:
+        Game(seed=ARGS.seed).run(ARGS.rounds)
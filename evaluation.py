@@ -0,0 +1,151 @@
+'''
+Variance-reduced estimates of player 1's winnings from hand histories.
+
+The raw delta of a round is mostly luck of the deal. Both estimators here
+subtract control variates from it, one for each card dealt on the flop, turn
+and river. With v the share of the pot which seat 0 would win if the round
+were checked down, using both permuted hands and the board dealt so far,
+the correction for a street is the pot when its cards are dealt times the
+change in v. The expected change in v over the cards which could be dealt
+is zero, so the corrections do not bias the estimate.
+
+The all-in EV estimator only corrects the streets dealt after a player is
+all-in, which replaces the result of an all-in with its equity. A player is
+all-in once the pot holds both starting stacks. The
+luck-adjusted estimator corrects every street dealt, in the style of AIVAT
+without the action corrections, which need the pokerbots' strategies.
+Equity is exact once the flop is dealt and is estimated from random boards
+before it, which adds noise but no bias.
+'''
+from numpy.random import RandomState
+import numpy as np
+import itertools
+import argparse
+import eval7
+
+from config import STARTING_STACK
+from handhistory import read_hand_history, STREET_INDICES, CARD_STRINGS
+from engine import Z_95
+
+CARDS = [eval7.Card(card) for card in CARD_STRINGS]
+BOARD_LENGTHS = (0, 3, 4, 5)
+ESTIMATORS = ('raw', 'all-in EV', 'luck-adjusted')
+
+
+def showdown_share(hands, board):
+    '''
+    Returns seat 0's share of the pot at showdown, 1, 0.5 or 0, given eval7 hands and a full board.
+    '''
+    score_0 = eval7.evaluate(board + hands[0])
+    score_1 = eval7.evaluate(board + hands[1])
+    return 1. if score_0 > score_1 else 0. if score_0 < score_1 else 0.5
+
+
+def equity(hands, board, random_state, samples):
+    '''
+    Returns seat 0's expected share of the pot at showdown.
+
+    Arguments:
+    hands: an array of shape (2, 2) of each seat's permuted card indices.
+    board: a list of the permuted card indices dealt so far.
+    random_state: the RandomState which draws boards when none of the board has been dealt.
+    samples: the number of boards drawn when none of the board has been dealt.
+    '''
+    dead = set(hands.flat) | set(board)
+    deck = np.array([card for card in range(52) if card not in dead])
+    if board:
+        runouts = itertools.combinations(deck, 5 - len(board))
+    else:
+        runouts = deck[random_state.rand(samples, len(deck)).argsort(axis=1)[:, :5]]
+    hand_cards = [[CARDS[card] for card in cards] for cards in hands]
+    board_cards = [CARDS[card] for card in board]
+    shares = [showdown_share(hand_cards, board_cards + [CARDS[card] for card in runout]) for runout in runouts]
+    return sum(shares) / len(shares)
+
+
+def round_values(hands, random_state, samples=1000):
+    '''
+    Computes player 1's winnings in every round of a hand history with each estimator.
+
+    Arguments:
+    hands: the rounds of a hand history, as returned by read_hand_history.
+    random_state: the RandomState which draws boards for pre-flop equities.
+    samples: the number of boards drawn for each pre-flop equity.
+
+    Returns:
+    An array of shape (len(hands), 3) of the raw, all-in EV and luck-adjusted values.
+    '''
+    values = np.empty((len(hands), len(ESTIMATORS)))
+    for i, hand in enumerate(hands):
+        # the seat of player 1, whose delta is -1 times seat 0's delta if it is seat 1
+        sign = 1 - 2 * int(hand['small_blind'])
+        delta = float(hand['deltas'][0])
+        streets_dealt = STREET_INDICES[int(hand['street'])]
+        all_in = hand['pots'][:streets_dealt + 1] == 2 * STARTING_STACK
+        all_in_street = int(np.argmax(all_in)) if all_in.any() else streets_dealt
+        corrections = np.zeros(streets_dealt + 1)
+        if streets_dealt > 0:
+            board = [int(card) for card in hand['permuted_board']]
+            equities = [equity(hand['permuted_hands'], board[:length], random_state, samples)
+                        for length in BOARD_LENGTHS[:streets_dealt + 1]]
+            for street in range(1, streets_dealt + 1):
+                corrections[street] = hand['pots'][street - 1] * (equities[street] - equities[street - 1])
+        values[i] = (sign * delta, sign * (delta - corrections[all_in_street + 1:].sum()),
+                     sign * (delta - corrections.sum()))
+    return values
+
+
+def summarize(values):
+    '''
+    Returns lines reporting the mean, standard deviation and 95% confidence interval of each
+    estimator, and the share of the raw estimator's variance which it leaves.
+    '''
+    rounds = len(values)
+    means = values.mean(axis=0)
+    variances = values.var(axis=0, ddof=1) if rounds > 1 else np.zeros(len(ESTIMATORS))
+    lines = ['Rounds: {}'.format(rounds),
+             '{:<14} {:>8} {:>8} {:>19} {:>9}'.format('estimator', 'mean', 'std dev', '95% CI', 'variance')]
+    for name, mean, variance in zip(ESTIMATORS, means, variances):
+        half_width = Z_95 * np.sqrt(variance / rounds)
+        share = variance / variances[0] if variances[0] > 0 else 1.
+        lines.append('{:<14} {:>8.3f} {:>8.2f} [{:>8.3f}, {:>8.3f}] {:>8.1%}'.format(
+            name, mean, np.sqrt(variance), mean - half_width, mean + half_width, share))
+    return lines
+
+
+def hand_history_name(path):
+    '''
+    Returns the name of a hand history given either its name or the path of one of its files.
+    '''
+    for suffix in ('.hands', '.actions'):
+        if path.endswith(suffix):
+            return path[:-len(suffix)]
+    return path
+
+
+def evaluate(names, seed=None, samples=1000):
+    '''
+    Returns the per-round values of player 1 in the hand histories of several games,
+    each given by its name or the path of its .hands or .actions file.
+    '''
+    random_state = RandomState(seed)
+    return np.concatenate([round_values(read_hand_history(hand_history_name(name))[0], random_state, samples)
+                           for name in names])
+
+
+def parse_args():
+    '''
+    Parses arguments describing the hand histories to evaluate.
+    '''
+    parser = argparse.ArgumentParser(prog='python3 evaluation.py')
+    parser.add_argument('--samples', type=int, default=1000,
+                        help='Number of boards drawn for each pre-flop equity, defaults to 1000')
+    parser.add_argument('--seed', type=int, default=None, help='Seed for the boards drawn for pre-flop equities')
+    parser.add_argument('names', nargs='+', help='Hand histories, e.g. gamelog or gamelog.hands')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    for line in summarize(evaluate(args.names, args.seed, args.samples)):
+        print(line)
@@ -0,0 +1,180 @@
+'''
+Machine-readable hand histories written by the engine alongside the game log.
+
+Each game writes two flat binary files of fixed-width little-endian records:
+<name>.hands holds one HAND_DTYPE record per round and <name>.actions holds
+one ACTION_DTYPE record per action, in the same order as the rounds. Files
+from several games may be concatenated. Seats are indexed as in the engine,
+so seat 0 is the small blind and small_blind names which player sat there.
+Cards are indexed as rank * 4 + suit (2c = 0, 2d = 1, ..., As = 51).
+
+If WRITE_LATENCY_LOG is set, <name>.latency holds one LATENCY_DTYPE record
+per query of a pokerbot, in the order the queries were made.
+'''
+import numpy as np
+from config import STARTING_STACK
+
+HAND_DTYPE = np.dtype([
+    ('seed', '<u8'),
+    ('round_num', '<u4'),
+    ('small_blind', 'i1'),  # 0 if player 1 posted the small blind, 1 otherwise
+    ('street', 'i1'),  # 0, 3, 4 or 5, the street on which the round ended
+    ('showdown', '?'),
+    ('hands', 'i1', (2, 2)),
+    ('permuted_hands', 'i1', (2, 2)),
+    ('board', 'i1', (5,)),  # all five cards, whether or not they were revealed
+    ('permuted_board', 'i1', (5,)),
+    ('pots', '<i2', (4,)),  # the pot at the end of pre-flop, flop, turn and river
+    ('deltas', '<i2', (2,)),
+    ('num_actions', '<u2'),
+])
+ACTION_DTYPE = np.dtype([
+    ('street', 'i1'),
+    ('seat', 'i1'),
+    ('action', 'i1'),
+    ('amount', '<i2'),  # the raise-to amount, 0 for other actions
+])
+
+LATENCY_DTYPE = np.dtype([
+    ('seed', '<u8'),
+    ('round_num', '<u4'),
+    ('player', 'i1'),  # 0 for player 1, 1 for player 2
+    ('street', 'i1'),  # 0, 3, 4 or 5, or -1 for the ack at the end of a round
+    ('seconds', '<f4'),  # the time from encoding the message to decoding the response
+    ('overhead', '<f4'),  # the part of it spent encoding, sending and decoding in the engine
+])
+
+FOLD, CALL, CHECK, RAISE = range(4)
+STREET_INDICES = {0: 0, 3: 1, 4: 2, 5: 3}
+CARD_STRINGS = [value + suit for value in '23456789TJQKA' for suit in 'cdhs']
+BLOCK_SIZE = 4096
+
+
+def card_index(card):
+    '''
+    Returns the index of an eval7 card.
+    '''
+    return card.rank * 4 + card.suit
+
+
+class HandHistoryWriter():
+    '''
+    Buffers hand history records in fixed-size blocks and appends them to disk.
+    '''
+
+    def __init__(self, name):
+        self.hands_file = open(name + '.hands', 'wb')
+        self.actions_file = open(name + '.actions', 'wb')
+        self.hands = np.zeros(BLOCK_SIZE, dtype=HAND_DTYPE)
+        self.num_hands = 0
+        self.actions = []
+
+    def record(self, seed, round_num, small_blind, perm_indices, terminal_state, actions):
+        '''
+        Records one finished round.
+
+        Arguments:
+        seed: the game's seed.
+        round_num: the round number.
+        small_blind: 0 if player 1 posted the small blind, 1 otherwise.
+        perm_indices: the permuted index of each card index.
+        terminal_state: the engine's TerminalState for the round.
+        actions: a list of (street, seat, action, amount) tuples in the order they were played.
+        '''
+        round_state = terminal_state.previous_state
+        hand = self.hands[self.num_hands]
+        hand['seed'] = seed
+        hand['round_num'] = round_num
+        hand['small_blind'] = small_blind
+        hand['street'] = round_state.street
+        hand['showdown'] = round_state.street == 5 and actions[-1][2] != FOLD
+        hands = [[card_index(card) for card in cards] for cards in round_state.hands]
+        board = [card_index(card) for card in round_state.deck.peek(5)]
+        hand['hands'] = hands
+        hand['permuted_hands'] = [[perm_indices[i] for i in cards] for cards in hands]
+        hand['board'] = board
+        hand['permuted_board'] = [perm_indices[i] for i in board]
+        pots = [0, 0, 0, 0]
+        while round_state is not None:
+            street = STREET_INDICES[round_state.street]
+            pots[street] = max(pots[street], 2 * STARTING_STACK - sum(round_state.stacks))
+            round_state = round_state.previous_state
+        hand['pots'] = pots
+        hand['deltas'] = terminal_state.deltas
+        hand['num_actions'] = len(actions)
+        self.actions.extend(actions)
+        self.num_hands += 1
+        if self.num_hands == BLOCK_SIZE:
+            self.flush()
+
+    def flush(self):
+        '''
+        Writes the buffered records to disk.
+        '''
+        self.hands[:self.num_hands].tofile(self.hands_file)
+        np.array(self.actions, dtype=ACTION_DTYPE).tofile(self.actions_file)
+        self.num_hands = 0
+        self.actions = []
+
+    def close(self):
+        '''
+        Flushes the remaining records and closes both files.
+        '''
+        self.flush()
+        self.hands_file.close()
+        self.actions_file.close()
+
+
+def read_hand_history(name):
+    '''
+    Loads a hand history as a structured array of rounds and a structured array of actions.
+    The actions of round i are actions[starts[i]:starts[i] + hands['num_actions'][i]].
+
+    Returns:
+    A tuple of hands, actions and starts.
+    '''
+    hands = np.fromfile(name + '.hands', dtype=HAND_DTYPE)
+    actions = np.fromfile(name + '.actions', dtype=ACTION_DTYPE)
+    starts = np.cumsum(hands['num_actions'], dtype=np.int64) - hands['num_actions']
+    return hands, actions, starts
+
+
+class LatencyWriter():
+    '''
+    Buffers response time records in fixed-size blocks and appends them to <name>.latency.
+    '''
+
+    def __init__(self, name):
+        self.latency_file = open(name + '.latency', 'wb')
+        self.records = np.zeros(BLOCK_SIZE, dtype=LATENCY_DTYPE)
+        self.num_records = 0
+
+    def record(self, seed, round_num, player, street, seconds, overhead):
+        '''
+        Records one query of a pokerbot, with arguments in the field order of LATENCY_DTYPE.
+        '''
+        self.records[self.num_records] = (seed, round_num, player, street, seconds, overhead)
+        self.num_records += 1
+        if self.num_records == BLOCK_SIZE:
+            self.flush()
+
+    def flush(self):
+        '''
+        Writes the buffered records to disk.
+        '''
+        self.records[:self.num_records].tofile(self.latency_file)
+        self.num_records = 0
+
+    def close(self):
+        '''
+        Flushes the remaining records and closes the file.
+        '''
+        self.flush()
+        self.latency_file.close()
+
+
+def read_latency_log(name):
+    '''
+    Loads the response times of a game as a structured array of queries.
+    '''
+    return np.fromfile(name + '.latency', dtype=LATENCY_DTYPE)
@@ -0,0 +1,26 @@
+package javabot.skeleton;
+
+import java.util.List;
+import java.util.ArrayList;
+import java.lang.String;
+
+/**
+ * One parsed clause of a message from the engine.
+ */
+public class Clause {
+    public final char kind;
+    public final int value;
+    public final float gameClock;
+    public final List<String> cards;
+
+    public Clause(char kind, int value, float gameClock, List<String> cards) {
+        this.kind = kind;
+        this.value = value;
+        this.gameClock = gameClock;
+        this.cards = cards;
+    }
+
+    public Clause(char kind) {
+        this(kind, 0, (float)0., new ArrayList<String>());
+    }
+}
\ No newline at end of file
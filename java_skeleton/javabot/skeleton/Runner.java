@@ -10,6 +10,14 @@ import java.net.Socket;
 import java.io.PrintWriter;
 import java.io.BufferedReader;
 import java.io.InputStreamReader;
+import java.io.InputStream;
+import java.io.OutputStream;
+import java.io.BufferedInputStream;
+import java.io.BufferedOutputStream;
+import java.io.DataInputStream;
+import java.io.DataOutputStream;
+import java.io.FileInputStream;
+import java.io.FileOutputStream;
 import java.io.IOException;
 
 /**
@@ -18,23 +26,159 @@ import java.io.IOException;
 public class Runner {
     private String host;
     private int port;
+    private int[] pipeFds;
+    private boolean binary;
     private Bot pokerbot;
     private Socket socket;
     private PrintWriter outStream;
     private BufferedReader inStream;
+    private DataOutputStream binaryOutStream;
+    private DataInputStream binaryInStream;
+
+    // binary protocol card codes are rank * 4 + suit
+    private static final String CARD_VALUES = "23456789TJQKA";
+    private static final String CARD_SUITS = "cdhs";
 
     /**
-     * Returns an incoming message from the engine.
+     * Returns the card string for a binary protocol card code.
+     */
+    private static String decodeCard(int code) {
+        return "" + CARD_VALUES.charAt(code / 4) + CARD_SUITS.charAt(code % 4);
+    }
+
+    /**
+     * Parses an incoming text message.
      */
-    public String[] receive() throws IOException {
+    private List<Clause> receiveText() throws IOException {
         String line = this.inStream.readLine().trim();
-        return line.split(" ");
+        List<Clause> clauses = new ArrayList<Clause>();
+        for (String text : line.split(" ")) {
+            char kind = text.charAt(0);
+            String leftover = text.substring(1, text.length());
+            switch (kind) {
+                case 'T': {
+                    clauses.add(new Clause(kind, 0, Float.parseFloat(leftover), new ArrayList<String>()));
+                    break;
+                }
+                case 'P':
+                case 'R':
+                case 'D': {
+                    clauses.add(new Clause(kind, Integer.parseInt(leftover), (float)0., new ArrayList<String>()));
+                    break;
+                }
+                case 'H':
+                case 'B':
+                case 'O': {
+                    clauses.add(new Clause(kind, 0, (float)0., Arrays.asList(leftover.split(","))));
+                    break;
+                }
+                default: {
+                    clauses.add(new Clause(kind));
+                    break;
+                }
+            }
+        }
+        return clauses;
+    }
+
+    /**
+     * Decodes an incoming length-prefixed binary message.
+     */
+    private List<Clause> receiveBinary() throws IOException {
+        byte[] payload = new byte[this.binaryInStream.readUnsignedShort()];
+        this.binaryInStream.readFully(payload);
+        List<Clause> clauses = new ArrayList<Clause>();
+        int i = 0;
+        while (i < payload.length) {
+            char kind = (char)payload[i];
+            switch (kind) {
+                case 'T': {
+                    long millis = ((payload[i+1] & 0xffL) << 24) | ((payload[i+2] & 0xff) << 16) |
+                                  ((payload[i+3] & 0xff) << 8) | (payload[i+4] & 0xff);
+                    clauses.add(new Clause(kind, 0, (float)(millis / 1000.), new ArrayList<String>()));
+                    i += 5;
+                    break;
+                }
+                case 'P': {
+                    clauses.add(new Clause(kind, payload[i+1] & 0xff, (float)0., new ArrayList<String>()));
+                    i += 2;
+                    break;
+                }
+                case 'R': {
+                    int amount = ((payload[i+1] & 0xff) << 8) | (payload[i+2] & 0xff);
+                    clauses.add(new Clause(kind, amount, (float)0., new ArrayList<String>()));
+                    i += 3;
+                    break;
+                }
+                case 'D': {
+                    int delta = (short)(((payload[i+1] & 0xff) << 8) | (payload[i+2] & 0xff));
+                    clauses.add(new Clause(kind, delta, (float)0., new ArrayList<String>()));
+                    i += 3;
+                    break;
+                }
+                case 'H':
+                case 'O': {
+                    List<String> cards = Arrays.asList(decodeCard(payload[i+1] & 0xff), decodeCard(payload[i+2] & 0xff));
+                    clauses.add(new Clause(kind, 0, (float)0., cards));
+                    i += 3;
+                    break;
+                }
+                case 'B': {
+                    int numCards = payload[i+1] & 0xff;
+                    List<String> cards = new ArrayList<String>();
+                    for (int j = 0; j < numCards; j++) {
+                        cards.add(decodeCard(payload[i+2+j] & 0xff));
+                    }
+                    clauses.add(new Clause(kind, 0, (float)0., cards));
+                    i += 2 + numCards;
+                    break;
+                }
+                default: {
+                    clauses.add(new Clause(kind));
+                    i += 1;
+                    break;
+                }
+            }
+        }
+        return clauses;
+    }
+
+    /**
+     * Returns an incoming message from the engine.
+     */
+    public List<Clause> receive() throws IOException {
+        return this.binary ? this.receiveBinary() : this.receiveText();
     }
 
     /**
      * Encodes an action and sends it to the engine.
      */
-    public void send(Action action) {
+    public void send(Action action) throws IOException {
+        if (this.binary) {
+            char opcode;
+            switch (action.actionType) {
+                case FOLD_ACTION_TYPE: {
+                    opcode = 'F';
+                    break;
+                }
+                case CALL_ACTION_TYPE: {
+                    opcode = 'C';
+                    break;
+                }
+                case CHECK_ACTION_TYPE: {
+                    opcode = 'K';
+                    break;
+                }
+                default: {  // RAISE_ACTION_TYPE
+                    opcode = 'R';
+                    break;
+                }
+            }
+            this.binaryOutStream.writeByte(opcode);
+            this.binaryOutStream.writeShort(opcode == 'R' ? action.amount : 0);
+            this.binaryOutStream.flush();
+            return;
+        }
         String code;
         switch (action.actionType) {
             case FOLD_ACTION_TYPE: {
@@ -68,27 +212,26 @@ public class Runner {
         int active = 0;
         boolean roundFlag = true;
         while (true) {
-            String[] packet = this.receive();
-            for (String clause : packet) {
-                String leftover = clause.substring(1, clause.length());
-                switch (clause.charAt(0)) {
+            List<Clause> packet = this.receive();
+            for (Clause clause : packet) {
+                switch (clause.kind) {
                     case 'T': {
-                        gameState = new GameState(gameState.bankroll, Float.parseFloat(leftover), gameState.roundNum);
+                        gameState = new GameState(gameState.bankroll, clause.gameClock, gameState.roundNum);
                         break;
                     }
                     case 'P': {
-                        active = Integer.parseInt(leftover);
+                        active = clause.value;
                         break;
                     }
                     case 'H': {
-                        String[] cards = leftover.split(",");
+                        List<String> cards = clause.cards;
                         List<List<String>> hands = new ArrayList<List<String>>(
                             Arrays.asList(
                                 new ArrayList<String>(),
                                 new ArrayList<String>()
                             )
                         );
-                        hands.set(active, Arrays.asList(cards[0], cards[1]));
+                        hands.set(active, Arrays.asList(cards.get(0), cards.get(1)));
                         hands.set(1 - active, Arrays.asList("", ""));
                         List<String> deck = new ArrayList<String>(Arrays.asList("", "", "", "", ""));
                         List<Integer> pips = Arrays.asList(State.SMALL_BLIND, State.BIG_BLIND);
@@ -115,14 +258,14 @@ public class Runner {
                     }
                     case 'R': {
                         roundState = ((RoundState)roundState).proceed(new Action(ActionType.RAISE_ACTION_TYPE,
-                                                                                 Integer.parseInt(leftover)));
+                                                                                 clause.value));
                         break;
                     }
                     case 'B': {
-                        String[] cards = leftover.split(",");
+                        List<String> cards = clause.cards;
                         List<String> revisedDeck = new ArrayList<String>(Arrays.asList("", "", "", "", ""));
-                        for (int i = 0; i < cards.length; i++) {
-                            revisedDeck.set(i, cards[i]);
+                        for (int i = 0; i < cards.size(); i++) {
+                            revisedDeck.set(i, cards.get(i));
                         }
                         RoundState maker = (RoundState)roundState;
                         roundState = new RoundState(maker.button, maker.street, maker.pips, maker.stacks,
@@ -131,11 +274,11 @@ public class Runner {
                     }
                     case 'O': {
                         // backtrack
-                        String[] cards = leftover.split(",");
+                        List<String> cards = clause.cards;
                         roundState = ((TerminalState)roundState).previousState;
                         RoundState maker = (RoundState)roundState;
                         List<List<String>> revisedHands = new ArrayList<List<String>>(maker.hands);
-                        revisedHands.set(1 - active, Arrays.asList(cards[0], cards[1]));
+                        revisedHands.set(1 - active, Arrays.asList(cards.get(0), cards.get(1)));
                         // rebuild history
                         roundState = new RoundState(maker.button, maker.street, maker.pips, maker.stacks,
                                                     revisedHands, maker.deck, maker.previousState);
@@ -143,7 +286,7 @@ public class Runner {
                         break;
                     }
                     case 'D': {
-                        int delta = Integer.parseInt(leftover);
+                        int delta = clause.value;
                         List<Integer> deltas = new ArrayList<Integer>(Arrays.asList(-1 * delta, -1 * delta));
                         deltas.set(active, delta);
                         roundState = new TerminalState(deltas, ((TerminalState)roundState).previousState);
@@ -175,15 +318,24 @@ public class Runner {
      */
     public void parseArgs(String[] rawArgs) {
         boolean hostFlag = false;
+        int pipeFlag = 0;
         this.host = "localhost";
         for (String arg : rawArgs) {
             if (arg.equals("-h") | arg.equals("--host")) {
                 hostFlag = true;
+            } else if (arg.equals("--binary")) {
+                this.binary = true;
+            } else if (arg.equals("--pipe")) {
+                this.pipeFds = new int[2];
+                pipeFlag = 2;
             } else if (arg.equals("--port")) {
                 // nothing to do
             } else if (hostFlag) {
                 this.host = arg;
                 hostFlag = false;
+            } else if (pipeFlag > 0) {
+                this.pipeFds[2 - pipeFlag] = Integer.parseInt(arg);
+                pipeFlag--;
             } else {
                 this.port = Integer.parseInt(arg);
             }
@@ -195,23 +347,50 @@ public class Runner {
      */
     public void runBot(Bot pokerbot) {
         this.pokerbot = pokerbot;
-        try {
-            this.socket = new Socket(this.host, this.port);
-            this.socket.setTcpNoDelay(true);
-            this.outStream = new PrintWriter(socket.getOutputStream(), true);
-            this.inStream = new BufferedReader(new InputStreamReader(socket.getInputStream()));
-        } catch (IOException e) {
-            System.out.println("Could not connect to " + host + ":" + Integer.toString(port));
-            return;
+        InputStream rawInStream;
+        OutputStream rawOutStream;
+        if (this.pipeFds != null) {
+            try {
+                // the engine passes pipes which we reopen through /dev/fd
+                rawOutStream = new FileOutputStream("/dev/fd/" + Integer.toString(this.pipeFds[1]));
+                rawInStream = new FileInputStream("/dev/fd/" + Integer.toString(this.pipeFds[0]));
+                rawOutStream.write("K\n".getBytes());  // tell the engine we are ready
+                rawOutStream.flush();
+            } catch (IOException e) {
+                System.out.println("Could not open pipes " + Integer.toString(this.pipeFds[0]) + " " +
+                                   Integer.toString(this.pipeFds[1]));
+                return;
+            }
+        } else {
+            try {
+                this.socket = new Socket(this.host, this.port);
+                this.socket.setTcpNoDelay(true);
+                rawOutStream = socket.getOutputStream();
+                rawInStream = socket.getInputStream();
+            } catch (IOException e) {
+                System.out.println("Could not connect to " + host + ":" + Integer.toString(port));
+                return;
+            }
+        }
+        if (this.binary) {
+            this.binaryOutStream = new DataOutputStream(new BufferedOutputStream(rawOutStream));
+            this.binaryInStream = new DataInputStream(new BufferedInputStream(rawInStream));
+        } else {
+            this.outStream = new PrintWriter(rawOutStream, true);
+            this.inStream = new BufferedReader(new InputStreamReader(rawInStream));
         }
         try {
             this.run();
-            this.inStream.close();
+            rawInStream.close();
             this.inStream = null;
-            this.outStream.close();
+            this.binaryInStream = null;
+            rawOutStream.close();
             this.outStream = null;
-            this.socket.close();
-            this.socket = null;
+            this.binaryOutStream = null;
+            if (this.socket != null) {
+                this.socket.close();
+                this.socket = null;
+            }
         } catch (IOException e) {
             System.out.println("Engine disconnected.");
         }
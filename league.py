@@ -0,0 +1,249 @@
+'''
+Runs a round-robin league between pokerbot versions and rates them with Elo.
+
+Every match result is cached in <league_dir>/results.json under the hash of
+each pokerbot's sources, the seed and a hash of the config values which affect
+play, so a league only plays the matches of pokerbots which are new or have
+changed since the last run. Each pair of pokerbots plays every seed twice,
+once as player 1 and once as player 2, and a match is won by the pokerbot
+which ends it with the higher bankroll. Ratings under each config are kept in
+<league_dir>/ratings_<config hash>.json with the results already applied to
+them, and each run applies only the new results, in a fixed order.
+
+Every pokerbot is built before it is hashed, and the files which any of its
+builds created or modified are recorded in <league_dir>/artifacts.json and
+left out of its hash, so rebuilding a pokerbot does not change its hash.
+'''
+from multiprocessing import Pool
+import statistics
+import argparse
+import hashlib
+import json
+import os
+
+from buildcache import BuildCache, walk_files, file_digest, snapshot, read_json, write_json
+import tournament
+import engine
+import config
+from config import *
+
+# THE CONFIG VALUES WHICH CHANGE THE RESULT OF A MATCH, AND SO ARE PART OF ITS CACHE KEY
+RESULT_CONFIG_KEYS = ['NUM_ROUNDS', 'STARTING_STACK', 'BIG_BLIND', 'SMALL_BLIND', 'STARTING_GAME_CLOCK',
+                      'ENFORCE_GAME_CLOCK', 'GAME_CLOCK_MODE', 'HEADLESS']
+INITIAL_RATING = 1500.
+K_FACTOR = 16.
+
+
+def build_artifacts(paths, league_dir):
+    '''
+    Builds the pokerbots and returns the files which any build of each pokerbot has created or
+    modified, by path. They are recorded in <league_dir>/artifacts.json, so that outputs which a
+    later build leaves untouched are still known to be artifacts.
+    '''
+    artifacts_filename = os.path.join(league_dir, 'artifacts.json')
+    artifacts = read_json(artifacts_filename, {})
+    before = {path: snapshot(path) for path in paths}
+    engine.build_pokerbots(paths, league_dir)
+    for path in paths:
+        built = set(artifacts.get(path, []))
+        built.update(relpath for relpath, stat in snapshot(path).items() if before[path].get(relpath) != stat)
+        if BUILD_CACHE_DIR is not None:  # a cache hit leaves outputs which are already up to date untouched
+            built.update(read_json(BuildCache(BUILD_CACHE_DIR).index_filename(path), []))
+        artifacts[path] = sorted(built)
+    write_json(artifacts_filename, artifacts)
+    return artifacts
+
+
+def source_hash(path, artifacts):
+    '''
+    Returns the hash of a pokerbot's sources, leaving out the given build artifacts.
+    '''
+    digest = hashlib.sha256()
+    for relpath in walk_files(path):
+        if relpath not in artifacts:
+            digest.update('{}\0{}\0'.format(relpath, file_digest(os.path.join(path, relpath))).encode())
+    return digest.hexdigest()
+
+
+def config_hash():
+    '''
+    Returns a short hash of the config values which change the result of a match.
+    '''
+    values = json.dumps([[key, getattr(config, key)] for key in RESULT_CONFIG_KEYS])
+    return hashlib.sha256(values.encode()).hexdigest()[:16]
+
+
+def expected_score(rating, opponent_rating):
+    '''
+    Returns the expected score of a player against an opponent under the Elo model.
+    '''
+    return 1. / (1. + 10. ** ((opponent_rating - rating) / 400.))
+
+
+class Ratings():
+    '''
+    Elo ratings of pokerbot versions by source hash, updated one match result at a time.
+    '''
+
+    def __init__(self, filename):
+        self.filename = filename
+        state = read_json(filename, {})
+        self.ratings = state.get('ratings', {})
+        self.matches = state.get('matches', {})
+        self.applied = set(state.get('applied', []))
+
+    def update(self, key, hashes, bankrolls):
+        '''
+        Applies one match result, unless it has been applied already.
+
+        Arguments:
+        key: the result's cache key.
+        hashes: the source hashes of player 1 and player 2.
+        bankrolls: the final bankrolls of player 1 and player 2.
+        '''
+        if key in self.applied:
+            return
+        rating_1, rating_2 = (self.ratings.get(source, INITIAL_RATING) for source in hashes)
+        score = 1. if bankrolls[0] > bankrolls[1] else 0. if bankrolls[0] < bankrolls[1] else 0.5
+        change = K_FACTOR * (score - expected_score(rating_1, rating_2))
+        self.ratings[hashes[0]] = rating_1 + change
+        self.ratings[hashes[1]] = rating_2 - change
+        for source in hashes:
+            self.matches[source] = self.matches.get(source, 0) + 1
+        self.applied.add(key)
+
+    def save(self):
+        '''
+        Atomically writes the ratings to disk.
+        '''
+        write_json(self.filename, {'ratings': self.ratings, 'matches': self.matches,
+                                   'applied': sorted(self.applied)})
+
+
+def result_key(hashes, seed, config_key):
+    '''
+    Returns the cache key of a match.
+    '''
+    return '{}:{}:{}:{}'.format(hashes[0], hashes[1], seed, config_key)
+
+
+def parse_key(key):
+    '''
+    Returns the source hashes, seed and config hash of a cache key.
+    '''
+    hash_1, hash_2, seed, config_key = key.split(':')
+    return (hash_1, hash_2), int(seed), config_key
+
+
+def standings(bots, results, ratings, config_key):
+    '''
+    Returns lines ranking the given pokerbots by rating, with their record under the current config.
+
+    Arguments:
+    bots: a list of (path, source hash) pairs.
+    results: the cached results by key.
+    ratings: the league's Ratings.
+    config_key: the current config hash.
+    '''
+    records = {source: [] for _, source in bots}
+    for key, bankrolls in results.items():
+        hashes, _, key_config = parse_key(key)
+        if key_config != config_key:
+            continue
+        for seat, source in enumerate(hashes):
+            if source in records:
+                records[source].append(bankrolls[seat])
+    ranked = sorted(bots, key=lambda bot: -ratings.ratings.get(bot[1], INITIAL_RATING))
+    lines = ['{:<4} {:<24} {:<8} {:>7} {:>7} {:>11} {:>9}'.format(
+        'rank', 'pokerbot', 'hash', 'rating', 'matches', 'W-L-T', 'bankroll')]
+    for rank, (path, source) in enumerate(ranked, 1):
+        bankrolls = records[source]
+        record = '{}-{}-{}'.format(sum(bankroll > 0 for bankroll in bankrolls),
+                                   sum(bankroll < 0 for bankroll in bankrolls),
+                                   sum(bankroll == 0 for bankroll in bankrolls))
+        mean = statistics.mean(bankrolls) if bankrolls else 0.
+        lines.append('{:<4} {:<24} {:<8} {:>7.1f} {:>7} {:>11} {:>9.1f}'.format(
+            rank, os.path.relpath(path), source[:8], ratings.ratings.get(source, INITIAL_RATING),
+            ratings.matches.get(source, 0), record, mean))
+    return lines
+
+
+def run_league(args):
+    '''
+    Plays every uncached match between the pokerbots on a process pool, updates the ratings
+    with the new results and reports the standings.
+    '''
+    os.makedirs(args.league_dir, exist_ok=True)
+    results_filename = os.path.join(args.league_dir, 'results.json')
+    results = read_json(results_filename, {})
+    config_key = config_hash()
+    ratings = Ratings(os.path.join(args.league_dir, 'ratings_{}.json'.format(config_key)))
+    paths = []
+    for path in map(os.path.abspath, args.bots):
+        if path not in paths:
+            paths.append(path)
+    artifacts = build_artifacts(paths, args.league_dir)
+    bots = []
+    for path in paths:
+        source = source_hash(path, set(artifacts[path]))
+        duplicates = [other_path for other_path, other in bots if other == source]
+        if duplicates:
+            print('Skipping', os.path.relpath(path), 'which is identical to', os.path.relpath(duplicates[0]))
+            continue
+        bots.append((path, source))
+    matches = []
+    jobs = []
+    for path_1, hash_1 in bots:
+        for path_2, hash_2 in bots:
+            if hash_1 == hash_2:
+                continue
+            for seed in range(args.seeds):
+                key = result_key((hash_1, hash_2), seed, config_key)
+                if key in results:
+                    continue
+                log_dir = os.path.join(args.league_dir, 'matches', '{}_{}_{}_{}'.format(
+                    hash_1[:12], hash_2[:12], config_key, seed))
+                jobs.append(([(len(matches), seed, log_dir, False)], (path_1, path_2), False))
+                matches.append((key, os.path.relpath(path_1), os.path.relpath(path_2)))
+    print('Playing', len(jobs), 'new matches between', len(bots), 'pokerbots on', args.workers, 'workers')
+    if jobs:
+        with Pool(args.workers) as pool:
+            for match_results in pool.imap_unordered(tournament.run_matches, jobs):
+                for match_num, seed, _, bankrolls, _ in match_results:
+                    key, name_1, name_2 = matches[match_num]
+                    results[key] = [bankrolls[PLAYER_1_NAME], bankrolls[PLAYER_2_NAME]]
+                    print('Match', name_1, 'vs', name_2, 'seed', seed, PLAYER_1_NAME, bankrolls[PLAYER_1_NAME],
+                          PLAYER_2_NAME, bankrolls[PLAYER_2_NAME])
+                # saved after every match, so an interrupted league resumes where it stopped
+                write_json(results_filename, results)
+    # results are applied in key order, so ratings do not depend on the order in which matches finished
+    for key in sorted(results):
+        hashes, _, key_config = parse_key(key)
+        if key_config == config_key:
+            ratings.update(key, hashes, results[key])
+    ratings.save()
+    print()
+    for line in standings(bots, results, ratings, config_key):
+        print(line)
+    return ratings
+
+
+def parse_args():
+    '''
+    Parses arguments describing the league.
+    '''
+    parser = argparse.ArgumentParser(prog='python3 league.py')
+    parser.add_argument('--seeds', type=int, default=2,
+                        help='Number of seeds each ordered pair of pokerbots plays, defaults to 2')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of worker processes, defaults to the CPU count')
+    parser.add_argument('--league-dir', type=str, default='league',
+                        help='Directory for the result cache, ratings and per-match logs, defaults to league')
+    parser.add_argument('bots', nargs='*', help='Pokerbot directories, defaults to every directory with a commands.json')
+    args = parser.parse_args()
+    if not args.bots:
+        args.bots = sorted(name for name in os.listdir('.') if os.path.isfile(os.path.join(name, 'commands.json')))
+    return args
+
+
+if __name__ == '__main__':
+    run_league(parse_args())
@@ -0,0 +1,58 @@
+'''
+Tests that a league keeps the cached results of compiled pokerbots across runs.
+'''
+from unittest import mock
+import argparse
+import unittest
+import tempfile
+import shutil
+import os
+
+import league
+import engine
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@unittest.skipUnless(shutil.which('make') and shutil.which('g++'), 'needs make and g++ to build cpp_skeleton')
+class LeagueCacheTest(unittest.TestCase):
+    '''
+    Runs a league twice over a compiled pokerbot, which is rebuilt by each run.
+    '''
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.bots = []
+        for name in ('cpp_skeleton', 'python_skeleton'):
+            path = os.path.join(self.temp_dir, name)
+            shutil.copytree(os.path.join(REPO_DIR, name), path, ignore=shutil.ignore_patterns('__pycache__', 'cppbot'))
+            self.bots.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def run_league_twice(self):
+        '''
+        Returns the number of cached results after each of two runs of the same league.
+        '''
+        args = argparse.Namespace(seeds=1, workers=2, league_dir=os.path.join(self.temp_dir, 'league'),
+                                  bots=self.bots)
+        counts = []
+        for _ in range(2):
+            league.run_league(args)
+            counts.append(len(league.read_json(os.path.join(args.league_dir, 'results.json'), {})))
+        return counts
+
+    def test_rebuilt_without_cache(self):
+        with mock.patch.object(league, 'BUILD_CACHE_DIR', None), mock.patch.object(engine, 'BUILD_CACHE_DIR', None):
+            self.assertEqual(self.run_league_twice(), [2, 2])
+
+    def test_rebuilt_with_cache(self):
+        build_cache_dir = os.path.join(self.temp_dir, 'build_cache')
+        with mock.patch.object(league, 'BUILD_CACHE_DIR', build_cache_dir), \
+                mock.patch.object(engine, 'BUILD_CACHE_DIR', build_cache_dir):
+            self.assertEqual(self.run_league_twice(), [2, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,235 @@
+'''
+Runs many independent engine matches in parallel and aggregates the results.
+'''
+from multiprocessing import Pool
+from contextlib import redirect_stdout
+from collections import deque
+import statistics
+import argparse
+import queue
+import random
+import numpy.random
+import math
+import os
+
+import engine
+from config import *
+
+# THE SEQUENTIAL TEST WAITS FOR THIS MANY MATCHES BEFORE TRUSTING ITS VARIANCE ESTIMATE
+SPRT_MIN_MATCHES = 10
+
+
+def run_matches(job):
+    '''
+    Runs consecutive matches, each in its own log directory, reusing the same pokerbot
+    processes for as long as they support new games and stay within their game clocks.
+    Engine output goes to engine.txt in each log directory, and pokerbot output to the
+    log directory of the match in which the pokerbot was launched. The pokerbot
+    directories must have been built beforehand with engine.build_pokerbots.
+    Returns the match number, seed, whether seats were swapped, bankrolls and, if the job
+    records deltas, player 1's delta from each deal of every match, or None.
+    '''
+    matches, player_paths, record_deltas = job
+    results = []
+    players = None
+    for match_num, seed, log_dir, swap_seats in matches:
+        os.makedirs(log_dir, exist_ok=True)
+        with open(os.path.join(log_dir, 'engine.txt'), 'w') as engine_log:
+            with redirect_stdout(engine_log):
+                if players is not None and not all(player.reusable() for player in players):
+                    engine.stop_players(players)
+                    players = None
+                if players is None:
+                    if HEADLESS:  # so that in-process pokerbots are constructed the same way in every worker
+                        random.seed(seed)
+                        numpy.random.seed(seed)
+                    players = engine.launch_players(player_paths, log_dir, built=True)
+                game = engine.Game(player_paths, log_dir, seed, swap_seats=swap_seats, record_deltas=record_deltas)
+                bankrolls = game.run(players=players)
+        results.append((match_num, seed, swap_seats, bankrolls, game.deal_deltas))
+    with open(os.path.join(log_dir, 'engine.txt'), 'a') as engine_log:
+        with redirect_stdout(engine_log):
+            engine.stop_players(players)
+    return results
+
+
+def summarize(deltas):
+    '''
+    Returns the mean, sample variance and 95% confidence interval of per-match bankroll deltas.
+    '''
+    mean = statistics.mean(deltas)
+    variance = statistics.variance(deltas) if len(deltas) > 1 else 0.
+    half_width = engine.Z_95 * math.sqrt(variance / len(deltas))
+    return mean, variance, (mean - half_width, mean + half_width)
+
+
+class SPRT():
+    '''
+    A sequential probability ratio test of whether player 1's mean bankroll per match is mu1
+    (H1) rather than mu0 (H0). Bankrolls are treated as normally distributed with the sample
+    variance of the matches played so far, so the log-likelihood ratio after n matches with
+    mean m and variance v is n * (mu1 - mu0) * (m - (mu0 + mu1) / 2) / v.
+    '''
+
+    def __init__(self, mu0, mu1, alpha, beta):
+        self.mu0 = mu0
+        self.mu1 = mu1
+        self.lower = math.log(beta / (1 - alpha))
+        self.upper = math.log((1 - beta) / alpha)
+
+    def llr(self, deltas):
+        '''
+        Returns the log-likelihood ratio of H1 to H0 given per-match bankroll deltas.
+        '''
+        if len(deltas) < max(SPRT_MIN_MATCHES, 2):
+            return 0.
+        mean, variance, _ = summarize(deltas)
+        evidence = (self.mu1 - self.mu0) * (mean - (self.mu0 + self.mu1) / 2)
+        if variance == 0:  # every match ended the same way
+            return math.copysign(math.inf, evidence) if evidence != 0 else 0.
+        return len(deltas) * evidence / variance
+
+    def decide(self, deltas):
+        '''
+        Returns 'H1' or 'H0' once the log-likelihood ratio crosses one of the bounds, or None.
+        '''
+        llr = self.llr(deltas)
+        if llr >= self.upper:
+            return 'H1'
+        if llr <= self.lower:
+            return 'H0'
+        return None
+
+    def evidence(self, deltas, decision):
+        '''
+        Returns lines describing the state of the test.
+        '''
+        hypotheses = {'H0': self.mu0, 'H1': self.mu1}
+        lines = ['SPRT of {} mean bankroll {} (H0) vs {} (H1)'.format(PLAYER_1_NAME, self.mu0, self.mu1),
+                 'Log-likelihood ratio: {:.3f} after {} matches, bounds [{:.3f}, {:.3f}]'.format(
+                     self.llr(deltas), len(deltas), self.lower, self.upper)]
+        if decision is None:
+            lines.append('No decision reached')
+        else:
+            lines.append('Accepted {}: mean bankroll {}'.format(decision, hypotheses[decision]))
+        return lines
+
+
+def report(results, log_dir):
+    '''
+    Writes (match, seed, player 1 bankroll, player 2 bankroll) results to results.txt in
+    log_dir, reports the aggregate bankroll statistics and returns the sorted results.
+    '''
+    results.sort()
+    with open(os.path.join(log_dir, 'results.txt'), 'w') as results_file:
+        results_file.write('match seed {} {}\n'.format(PLAYER_1_NAME, PLAYER_2_NAME))
+        for result in results:
+            results_file.write(' '.join(map(str, result)) + '\n')
+    deltas = [result[2] for result in results]
+    print()
+    print('Matches played:', len(deltas))
+    if not deltas:
+        return results
+    mean, variance, (low, high) = summarize(deltas)
+    print(PLAYER_1_NAME, 'wins', sum(delta > 0 for delta in deltas), 'ties', sum(delta == 0 for delta in deltas),
+          'losses', sum(delta < 0 for delta in deltas))
+    print('Mean bankroll of {}: {:.2f}'.format(PLAYER_1_NAME, mean))
+    print('Variance: {:.2f}'.format(variance))
+    print('95% confidence interval: [{:.2f}, {:.2f}]'.format(low, high))
+    return results
+
+
+def parse_args():
+    '''
+    Parses arguments describing the tournament.
+    '''
+    parser = argparse.ArgumentParser(prog='python3 tournament.py')
+    parser.add_argument('--matches', type=int, default=100, help='Number of matches to play, defaults to 100')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of worker processes, defaults to the CPU count')
+    parser.add_argument('--seed', type=int, default=None, help='Master seed from which each match seed is derived')
+    parser.add_argument('--reuse', type=int, default=1,
+                        help='Number of consecutive matches played by the same pokerbot processes, defaults to 1')
+    parser.add_argument('--duplicate', action='store_true',
+                        help='Play each match twice over the same deals, the second time with seats swapped')
+    parser.add_argument('--sprt', type=float, nargs=2, metavar=('MU0', 'MU1'), default=None,
+                        help='Stop early once a sequential test decides whether the mean bankroll is MU0 or MU1')
+    parser.add_argument('--alpha', type=float, default=0.05, help='SPRT false positive rate, defaults to 0.05')
+    parser.add_argument('--beta', type=float, default=0.05, help='SPRT false negative rate, defaults to 0.05')
+    parser.add_argument('--log-dir', type=str, default='tournament', help='Directory for per-match logs, defaults to tournament')
+    parser.add_argument('player_1_path', nargs='?', default=PLAYER_1_PATH, help='Defaults to PLAYER_1_PATH')
+    parser.add_argument('player_2_path', nargs='?', default=PLAYER_2_PATH, help='Defaults to PLAYER_2_PATH')
+    return parser.parse_args()
+
+
+def run_tournament(args):
+    '''
+    Plays every match on a process pool and reports the aggregate bankroll statistics.
+    A duplicate match is scored by each player's combined bankroll from both of its games.
+    Jobs are submitted as workers free up, so that with --sprt no new matches are started
+    once the test reaches a decision. Matches already in progress are still played and reported.
+    '''
+    master_seed = args.seed if args.seed is not None else random.randrange(2 ** 32)
+    player_paths = (os.path.abspath(args.player_1_path), os.path.abspath(args.player_2_path))
+    seatings = (False, True) if args.duplicate else (False,)
+    matches = [(match_num, (master_seed + match_num) % 2 ** 32,
+                os.path.join(args.log_dir, 'match_{:05d}{}'.format(match_num, '_swapped' if swap_seats else '')),
+                swap_seats)
+               for match_num in range(args.matches) for swap_seats in seatings]
+    reuse = max(args.reuse, 1)
+    jobs = deque((matches[i:i + reuse], player_paths, args.duplicate) for i in range(0, len(matches), reuse))
+    print('Playing', args.matches, 'matches of', player_paths[0], 'vs', player_paths[1],
+          'on', args.workers, 'workers with master seed', master_seed)
+    os.makedirs(args.log_dir, exist_ok=True)
+    engine.build_pokerbots(player_paths, args.log_dir)
+    sprt = SPRT(args.sprt[0], args.sprt[1], args.alpha, args.beta) if args.sprt is not None else None
+    decision = None
+    results = []
+    games = {}
+    pairs = []
+    finished = queue.Queue()
+    with Pool(args.workers) as pool:
+        in_flight = 0
+        while jobs and in_flight < args.workers:
+            pool.apply_async(run_matches, (jobs.popleft(),), callback=finished.put, error_callback=finished.put)
+            in_flight += 1
+        while in_flight > 0:
+            match_results = finished.get()
+            in_flight -= 1
+            if isinstance(match_results, BaseException):
+                raise match_results
+            for match_num, seed, swap_seats, bankrolls, deal_deltas in match_results:
+                games.setdefault(match_num, {})[swap_seats] = (bankrolls, deal_deltas)
+                if len(games[match_num]) < len(seatings):
+                    continue
+                played = games.pop(match_num)
+                totals = [sum(bankrolls[name] for bankrolls, _ in played.values())
+                          for name in (PLAYER_1_NAME, PLAYER_2_NAME)]
+                results.append((match_num, seed, totals[0], totals[1]))
+                print('Match', match_num, 'seed', seed, PLAYER_1_NAME, totals[0], PLAYER_2_NAME, totals[1])
+                if args.duplicate:
+                    first, second = played[False][1], played[True][1]
+                    pairs.extend((first[round_num], second[round_num]) for round_num in sorted(first)
+                                 if round_num in second)
+                if sprt is not None and decision is None:
+                    decision = sprt.decide([result[2] for result in results])
+                    if decision is not None:
+                        print('SPRT accepted', decision, 'after', len(results), 'matches, stopping')
+                        sprt_lines = sprt.evidence([result[2] for result in results], decision)
+            if jobs and decision is None:
+                pool.apply_async(run_matches, (jobs.popleft(),), callback=finished.put, error_callback=finished.put)
+                in_flight += 1
+    results = report(results, args.log_dir)
+    if args.duplicate:
+        for line in engine.duplicate_summary(pairs):
+            print(line)
+    if sprt is not None:
+        print()
+        if decision is None:
+            sprt_lines = sprt.evidence([result[2] for result in results], decision)
+        for line in sprt_lines:
+            print(line)
+    return results
+
+
+if __name__ == '__main__':
+    run_tournament(parse_args())
@@ -16,7 +16,7 @@ class Player(Bot):
 
     def __init__(self):
         '''
-        Called when a new game starts. Called exactly once.
+        Called when the pokerbot starts. Called exactly once.
 
         Arguments:
         Nothing.
@@ -25,9 +25,21 @@ class Player(Bot):
         Nothing.
         '''
         self.VALUES = ['2', '3', '4', '5', '6', '7', '8', '9', 'T', 'J', 'Q', 'K', 'A']
+        self.handle_new_game()
+
+    def handle_new_game(self):
+        '''
+        Called when a new game starts, from __init__ for the first game and by
+        the engine for each later game played by the same pokerbot.
+
+        Arguments:
+        Nothing.
+
+        Returns:
+        Nothing.
+        '''
         self.wins_dict = {v : 1 for v in self.VALUES}
         self.showdowns_dict = {v : 2 for v in self.VALUES}
-        pass
 
     def handle_new_round(self, game_state, round_state, active):
         '''
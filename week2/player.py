@@ -30,7 +30,7 @@ class Player(Bot):
 
     def __init__(self):
         '''
-        Called when a new game starts. Called exactly once.
+        Called when the pokerbot starts. Called exactly once.
 
         Arguments:
         Nothing.
@@ -42,7 +42,7 @@ class Player(Bot):
         # particle filter
         values = list('23456789TJQKA')
         suits = list('cdhs')
-        self.proposal_perms = []
+        self.initial_perms = []
         for j in range(10000):
             # proposal_perm is a list with entries from 0 to 12
             proposal_perm = self.permute_values()
@@ -55,7 +55,21 @@ class Player(Bot):
                     permuted_card = eval7.Card(permuted_v + s)
                     perm_dict[card] = permuted_card
             # we've gone through the whole deck
-            self.proposal_perms.append(perm_dict)
+            self.initial_perms.append(perm_dict)
+        self.handle_new_game()
+
+    def handle_new_game(self):
+        '''
+        Called when a new game starts, from __init__ for the first game and by
+        the engine for each later game played by the same pokerbot.
+
+        Arguments:
+        Nothing.
+
+        Returns:
+        Nothing.
+        '''
+        self.proposal_perms = self.initial_perms
 
     def handle_new_round(self, game_state, round_state, active):
         '''
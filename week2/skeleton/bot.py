@@ -8,6 +8,21 @@ class Bot():
     The base class for a pokerbot.
     '''
 
+    def handle_new_game(self):
+        '''
+        Called when the engine starts another game with the same pokerbot.
+        Not called for the first game, which follows __init__.
+        Also called on a shallow copy of the pokerbot for each table of a
+        multiplexed connection, so it must replace all per-game state.
+
+        Arguments:
+        Nothing.
+
+        Returns:
+        Nothing.
+        '''
+        raise NotImplementedError('handle_new_game')
+
     def handle_new_round(self, game_state, round_state, active):
         '''
         Called when a new round starts. Called NUM_ROUNDS times.
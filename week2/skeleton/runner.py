@@ -3,107 +3,261 @@ The infrastructure for interacting with the engine.
 '''
 import argparse
 import socket
+import copy
+import struct
+import io
 from .actions import FoldAction, CallAction, CheckAction, RaiseAction
 from .states import GameState, TerminalState, RoundState
 from .states import STARTING_STACK, BIG_BLIND, SMALL_BLIND
 from .bot import Bot
 
+# binary protocol card codes are rank * 4 + suit
+CARDS = [value + suit for value in '23456789TJQKA' for suit in 'cdhs']
+CARD_CODES = {card: code for code, card in enumerate(CARDS)}
 
 class Runner():
     '''
     Interacts with the engine.
     '''
 
-    def __init__(self, pokerbot, socketfile):
+    def __init__(self, pokerbot, socketfile, table_id=None):
         self.pokerbot = pokerbot
         self.socketfile = socketfile
+        self.table_id = table_id
+        self.game_state = GameState(0, 0., 1)
+        self.round_state = None
+        self.active = 0
+        self.round_flag = True
+
+    @staticmethod
+    def parse(line):
+        '''
+        Parses a text message into a list of (kind, value) clauses.
+        '''
+        packet = []
+        for clause in line.strip().split(' '):
+            kind = clause[0]
+            if kind in 'HBO':
+                packet.append((kind, clause[1:].split(',')))
+            elif kind in 'IPRD':
+                packet.append((kind, int(clause[1:])))
+            elif kind == 'T':
+                packet.append((kind, float(clause[1:])))
+            else:
+                packet.append((kind, None))
+        return packet
 
     def receive(self):
         '''
         Generator for incoming messages from the engine.
         '''
         while True:
-            packet = self.socketfile.readline().strip().split(' ')
-            if not packet:
+            line = self.socketfile.readline()
+            if not line:
                 break
-            yield packet
+            yield self.parse(line.decode())
+
+    @staticmethod
+    def encode(action):
+        '''
+        Encodes an action as a response clause.
+        '''
+        if isinstance(action, FoldAction):
+            return 'F'
+        if isinstance(action, CallAction):
+            return 'C'
+        if isinstance(action, CheckAction):
+            return 'K'
+        # isinstance(action, RaiseAction)
+        return 'R' + str(action.amount)
 
     def send(self, action):
         '''
         Encodes an action and sends it to the engine.
         '''
-        if isinstance(action, FoldAction):
-            code = 'F'
-        elif isinstance(action, CallAction):
-            code = 'C'
-        elif isinstance(action, CheckAction):
-            code = 'K'
-        else:  # isinstance(action, RaiseAction)
-            code = 'R' + str(action.amount)
-        self.socketfile.write(code + '\n')
+        prefix = '' if self.table_id is None else 'I{} '.format(self.table_id)
+        self.socketfile.write((prefix + self.encode(action) + '\n').encode())
         self.socketfile.flush()
 
+    def handle_packet(self, packet):
+        '''
+        Applies one message of (kind, value) clauses from the engine to the game tree.
+        Returns the action to send back, or None once the game is over.
+        '''
+        game_state = self.game_state
+        round_state = self.round_state
+        active = self.active
+        round_flag = self.round_flag
+        for kind, value in packet:
+            if kind == 'T':
+                game_state = GameState(game_state.bankroll, value, game_state.round_num)
+            elif kind == 'P':
+                active = value
+            elif kind == 'H':
+                hands = [[], []]
+                hands[active] = value
+                pips = [SMALL_BLIND, BIG_BLIND]
+                stacks = [STARTING_STACK - SMALL_BLIND, STARTING_STACK - BIG_BLIND]
+                round_state = RoundState(0, 0, pips, stacks, hands, [], None)
+                if round_flag:
+                    self.pokerbot.handle_new_round(game_state, round_state, active)
+                    round_flag = False
+            elif kind == 'F':
+                round_state = round_state.proceed(FoldAction())
+            elif kind == 'C':
+                round_state = round_state.proceed(CallAction())
+            elif kind == 'K':
+                round_state = round_state.proceed(CheckAction())
+            elif kind == 'R':
+                round_state = round_state.proceed(RaiseAction(value))
+            elif kind == 'B':
+                round_state = RoundState(round_state.button, round_state.street, round_state.pips, round_state.stacks,
+                                         round_state.hands, value, round_state.previous_state)
+            elif kind == 'O':
+                # backtrack
+                round_state = round_state.previous_state
+                revised_hands = list(round_state.hands)
+                revised_hands[1-active] = value
+                # rebuild history
+                round_state = RoundState(round_state.button, round_state.street, round_state.pips, round_state.stacks,
+                                         revised_hands, round_state.deck, round_state.previous_state)
+                round_state = TerminalState([0, 0], round_state)
+            elif kind == 'D':
+                assert isinstance(round_state, TerminalState)
+                delta = value
+                deltas = [-delta, -delta]
+                deltas[active] = delta
+                round_state = TerminalState(deltas, round_state.previous_state)
+                game_state = GameState(game_state.bankroll + delta, game_state.game_clock, game_state.round_num)
+                self.pokerbot.handle_round_over(game_state, round_state, active)
+                game_state = GameState(game_state.bankroll, game_state.game_clock, game_state.round_num + 1)
+                round_flag = True
+            elif kind == 'N':
+                game_state = GameState(0, game_state.game_clock, 1)
+                self.pokerbot.handle_new_game()
+            elif kind == 'Q':
+                return None
+        self.game_state = game_state
+        self.round_state = round_state
+        self.active = active
+        self.round_flag = round_flag
+        if round_flag:  # ack the engine
+            return CheckAction()
+        assert active == round_state.button % 2
+        return self.pokerbot.get_action(game_state, round_state, active)
+
     def run(self):
         '''
         Reconstructs the game tree based on the action history received from the engine.
         '''
-        game_state = GameState(0, 0., 1)
-        round_state = None
-        active = 0
-        round_flag = True
         for packet in self.receive():
-            for clause in packet:
-                if clause[0] == 'T':
-                    game_state = GameState(game_state.bankroll, float(clause[1:]), game_state.round_num)
-                elif clause[0] == 'P':
-                    active = int(clause[1:])
-                elif clause[0] == 'H':
-                    hands = [[], []]
-                    hands[active] = clause[1:].split(',')
-                    pips = [SMALL_BLIND, BIG_BLIND]
-                    stacks = [STARTING_STACK - SMALL_BLIND, STARTING_STACK - BIG_BLIND]
-                    round_state = RoundState(0, 0, pips, stacks, hands, [], None)
-                    if round_flag:
-                        self.pokerbot.handle_new_round(game_state, round_state, active)
-                        round_flag = False
-                elif clause[0] == 'F':
-                    round_state = round_state.proceed(FoldAction())
-                elif clause[0] == 'C':
-                    round_state = round_state.proceed(CallAction())
-                elif clause[0] == 'K':
-                    round_state = round_state.proceed(CheckAction())
-                elif clause[0] == 'R':
-                    round_state = round_state.proceed(RaiseAction(int(clause[1:])))
-                elif clause[0] == 'B':
-                    round_state = RoundState(round_state.button, round_state.street, round_state.pips, round_state.stacks,
-                                             round_state.hands, clause[1:].split(','), round_state.previous_state)
-                elif clause[0] == 'O':
-                    # backtrack
-                    round_state = round_state.previous_state
-                    revised_hands = list(round_state.hands)
-                    revised_hands[1-active] = clause[1:].split(',')
-                    # rebuild history
-                    round_state = RoundState(round_state.button, round_state.street, round_state.pips, round_state.stacks,
-                                             revised_hands, round_state.deck, round_state.previous_state)
-                    round_state = TerminalState([0, 0], round_state)
-                elif clause[0] == 'D':
-                    assert isinstance(round_state, TerminalState)
-                    delta = int(clause[1:])
-                    deltas = [-delta, -delta]
-                    deltas[active] = delta
-                    round_state = TerminalState(deltas, round_state.previous_state)
-                    game_state = GameState(game_state.bankroll + delta, game_state.game_clock, game_state.round_num)
-                    self.pokerbot.handle_round_over(game_state, round_state, active)
-                    game_state = GameState(game_state.bankroll, game_state.game_clock, game_state.round_num + 1)
-                    round_flag = True
-                elif clause[0] == 'Q':
-                    return
-            if round_flag:  # ack the engine
-                self.send(CheckAction())
+            action = self.handle_packet(packet)
+            if action is None:
+                return
+            self.send(action)
+
+
+class BinaryRunner(Runner):
+    '''
+    Interacts with the engine over the length-prefixed binary protocol.
+    '''
+
+    @staticmethod
+    def decode(payload):
+        '''
+        Decodes a binary message into a list of (kind, value) clauses.
+        '''
+        packet = []
+        i = 0
+        while i < len(payload):
+            kind = chr(payload[i])
+            if kind in 'HO':
+                packet.append((kind, [CARDS[payload[i+1]], CARDS[payload[i+2]]]))
+                i += 3
+            elif kind == 'B':
+                num_cards = payload[i+1]
+                packet.append((kind, [CARDS[code] for code in payload[i+2:i+2+num_cards]]))
+                i += 2 + num_cards
+            elif kind == 'T':
+                packet.append((kind, struct.unpack_from('>I', payload, i+1)[0] / 1000.))
+                i += 5
+            elif kind == 'P':
+                packet.append((kind, payload[i+1]))
+                i += 2
+            elif kind in 'IR':
+                packet.append((kind, struct.unpack_from('>H', payload, i+1)[0]))
+                i += 3
+            elif kind == 'D':
+                packet.append((kind, struct.unpack_from('>h', payload, i+1)[0]))
+                i += 3
             else:
-                assert active == round_state.button % 2
-                action = self.pokerbot.get_action(game_state, round_state, active)
-                self.send(action)
+                packet.append((kind, None))
+                i += 1
+        return packet
+
+    def receive(self):
+        '''
+        Generator for incoming messages from the engine.
+        '''
+        while True:
+            header = self.socketfile.read(2)
+            if len(header) < 2:
+                break
+            length = struct.unpack('>H', header)[0]
+            yield self.decode(self.socketfile.read(length))
+
+    def send(self, action):
+        '''
+        Encodes an action as an opcode and amount and sends it to the engine.
+        '''
+        code = self.encode(action)
+        amount = action.amount if code[0] == 'R' else 0
+        prefix = b'' if self.table_id is None else struct.pack('>cH', b'I', self.table_id)
+        self.socketfile.write(prefix + struct.pack('>cH', code[0].encode(), amount))
+        self.socketfile.flush()
+
+
+class MultiplexRunner():
+    '''
+    Plays many tables over one connection. Every message starts with an I clause
+    carrying its table id, and each table is played by its own runner and its own
+    shallow copy of the pokerbot, reset with handle_new_game. The copies share
+    whatever the pokerbot precomputed in __init__, which they must not modify.
+    '''
+
+    def __init__(self, pokerbot, runner_class, socketfile):
+        self.pokerbot = pokerbot
+        self.runner_class = runner_class
+        self.socketfile = socketfile
+        self.tables = {}
+
+    def table_runner(self, table_id):
+        '''
+        Returns the runner of a table, seating a new copy of the pokerbot at a new table.
+        '''
+        runner = self.tables.get(table_id)
+        if runner is None:
+            pokerbot = copy.copy(self.pokerbot)
+            pokerbot.handle_new_game()
+            runner = self.runner_class(pokerbot, self.socketfile, table_id)
+            self.tables[table_id] = runner
+        return runner
+
+    def run(self):
+        '''
+        Routes each message to its table until the engine closes the connection.
+        A table is closed when its game is over.
+        '''
+        receiver = self.runner_class(self.pokerbot, self.socketfile)
+        for packet in receiver.receive():
+            kind, table_id = packet[0]
+            assert kind == 'I'
+            runner = self.table_runner(table_id)
+            action = runner.handle_packet(packet[1:])
+            if action is None:
+                del self.tables[table_id]
+            else:
+                runner.send(action)
 
 
 def parse_args():
@@ -112,21 +266,51 @@ def parse_args():
     '''
     parser = argparse.ArgumentParser(prog='python3 player.py')
     parser.add_argument('--host', type=str, default='localhost', help='Host to connect to, defaults to localhost')
-    parser.add_argument('port', type=int, help='Port on host to connect to')
+    parser.add_argument('--unix', type=str, default=None, help='Unix domain socket to connect to instead of a port')
+    parser.add_argument('--pipe', type=int, nargs=2, default=None, metavar=('READ_FD', 'WRITE_FD'),
+                        help='Inherited pipes to use instead of a socket')
+    parser.add_argument('--binary', action='store_true', help='Use the binary protocol instead of text')
+    parser.add_argument('--multiplex', action='store_true', help='Play many tables, each with its own table id')
+    parser.add_argument('port', type=int, nargs='?', help='Port on host to connect to')
     return parser.parse_args()
 
+def connect(args):
+    '''
+    Connects to the engine over the transport it chose.
+    Returns the socket, or None for pipes, and a binary file for reading and writing messages,
+    whose read and write buffers are independent so that writing never drops unread messages.
+    '''
+    if args.pipe is not None:
+        pipes = io.BufferedRWPair(io.FileIO(args.pipe[0], 'r'), io.FileIO(args.pipe[1], 'w'))
+        pipes.write(b'K\n')  # tell the engine we are ready
+        pipes.flush()
+        return None, pipes
+    if args.unix is not None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(args.unix)
+    else:
+        sock = socket.create_connection((args.host, args.port))
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock, sock.makefile('rwb')
+
 def run_bot(pokerbot, args):
     '''
     Runs the pokerbot.
     '''
     assert isinstance(pokerbot, Bot)
     try:
-        sock = socket.create_connection((args.host, args.port))
+        sock, socketfile = connect(args)
     except OSError:
-        print('Could not connect to {}:{}'.format(args.host, args.port))
+        if args.pipe is not None:
+            print('Could not open pipes {} {}'.format(*args.pipe))
+        else:
+            print('Could not connect to {}'.format(args.unix or '{}:{}'.format(args.host, args.port)))
         return
-    socketfile = sock.makefile('rw')
-    runner = Runner(pokerbot, socketfile)
-    runner.run()
+    runner_class = BinaryRunner if args.binary else Runner
+    if args.multiplex:
+        MultiplexRunner(pokerbot, runner_class, socketfile).run()
+    else:
+        runner_class(pokerbot, socketfile).run()
     socketfile.close()
-    sock.close()
+    if sock is not None:
+        sock.close()